@@ -1,57 +1,153 @@
-from sqlalchemy import create_engine, Column, String, Integer, JSON, DateTime, ForeignKey, Text
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy import create_engine, event, select, update, delete, text, type_coerce, Index, Column, String, Integer, DateTime, ForeignKey, Text, TypeDecorator
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session, relationship
 from sqlalchemy.sql import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from datetime import datetime
 import time 
+import copy
+import itertools
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 import logging
-import uuid 
+from contextlib import contextmanager
+import orjson
 Base = declarative_base()
 
 
+class FastJSON(TypeDecorator):
+    """JSON column serialized with orjson; reads rows written by the old JSON type"""
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else orjson.dumps(value).decode()
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else orjson.loads(value)
+
+
+def random_hex_id():
+    # evaluated by SQLite inside the INSERT, so no per-row Python callback
+    return func.lower(func.hex(func.randomblob(16)))
+
+
+# The DEFAULT in the table DDL gives raw SQL and bulk INSERTs an id too. The ORM still sends
+# random_hex_id() because tables created before this default have none and are never altered.
+HEX_ID_SERVER_DEFAULT = text("(lower(hex(randomblob(16))))")
+
+
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True, autoincrement=True)
     email = Column(String, unique=True, nullable=False)
-    google_token = Column(JSON)
-    created_at = Column(DateTime, default=func.now())
-    processed_emails = relationship("ProcessedEmail", backref="user")
-    calendar_events = relationship("CalendarEvent", backref="user")
+    google_token = Column(FastJSON)
+    # server_default stamps rows in SQLite; default= is kept for tables created without it
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
+    # collections are never needed implicitly; load them with selectinload() when required
+    processed_emails = relationship("ProcessedEmail", back_populates="user", lazy="raise")
+    calendar_events = relationship("CalendarEvent", back_populates="user", lazy="raise")
 
 class ProcessedEmail(Base):
     __tablename__ = 'processed_emails'
-    id = Column(String(50), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String(50), primary_key=True, default=random_hex_id(), server_default=HEX_ID_SERVER_DEFAULT)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     thread_id = Column(String)
     subject = Column(String)
     from_email = Column(String)
-    processed_at = Column(DateTime, default=func.now())
+    processed_at = Column(DateTime, default=func.now(), server_default=func.now())
     category = Column(String)
-    actions = Column(JSON)
+    actions = Column(FastJSON)
     ai_response = Column(String)
     snippet = Column(String)
-    sent_at = Column(DateTime, default=lambda: datetime.utcnow())
-    calendar_event = relationship("CalendarEvent", backref="email", uselist=False) 
+    sent_at = Column(DateTime, default=func.now(), server_default=func.now())
+    # not loaded by default; opt in with joinedload()/selectinload() on the query that reads them
+    user = relationship("User", back_populates="processed_emails", lazy="raise")
+    calendar_event = relationship("CalendarEvent", back_populates="email", uselist=False, lazy="raise")
+    __table_args__ = (
+        Index('ix_pe_thread_cat_sent', 'thread_id', 'category', 'sent_at'),
+        Index('ix_pe_user_id', 'user_id'),
+    )
 
 class CalendarEvent(Base):
     __tablename__ = 'calendar_events'
-    id = Column(String(50), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String(50), primary_key=True, default=random_hex_id(), server_default=HEX_ID_SERVER_DEFAULT)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     email_id = Column(String, ForeignKey('processed_emails.id'))
     title = Column(String)
     start_time = Column(DateTime)
     end_time = Column(DateTime)
-    attendees = Column(JSON)
-    created_at = Column(DateTime, default=func.now())
+    attendees = Column(FastJSON)
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
     timezone = Column(String)  
     description = Column(Text)  
     location = Column(String)  
     google_event_id = Column(String, unique=True)
+    user = relationship("User", back_populates="calendar_events")
+    email = relationship("ProcessedEmail", back_populates="calendar_event")
+    __table_args__ = (
+        Index('ix_ce_email_id', 'email_id'),
+    )
 
 
-def init_db(db_path='email_assistant.db'):
-    engine = create_engine(f'sqlite:///{db_path}')
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA busy_timeout=5000",
+)
+
+SQLITE_IN_CHUNK = 500
+
+AI_CACHE_PRUNE_EVERY = 64  # cache inserts between evictions; the table may run this far over max_entries
+
+USER_CACHE_TTL = 60
+USER_CACHE_MAXSIZE = 1024
+# shared by every DatabaseService so invalidation in one instance is seen by the others
+_user_cache = {}
+
+def create_sqlite_engine(db_path='email_assistant.db', readonly=False):
+    if db_path == ':memory:':
+        return create_engine('sqlite://', echo=False, query_cache_size=1200)
+
+    if readonly:
+        url = f'sqlite:///file:{db_path}?mode=ro&uri=true'
+        pool_args = {'pool_size': 8}
+        # journal_mode is persistent and can't be changed from a read-only connection
+        pragmas = [p for p in SQLITE_PRAGMAS if 'journal_mode' not in p]
+    else:
+        url = f'sqlite:///{db_path}'
+        # SQLite allows one writer at a time; queue writers here instead of on busy_timeout
+        pool_args = {'pool_size': 1, 'max_overflow': 0}
+        pragmas = SQLITE_PRAGMAS
+
+    engine = create_engine(
+        url,
+        echo=False,
+        query_cache_size=1200,
+        connect_args={"check_same_thread": False},
+        **pool_args
+    )
+
+    # WAL lets reads run alongside writes and drops one fsync per commit
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+    return engine
+
+def create_schema(engine):
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add any missing indexes separately
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def init_db(db_path='email_assistant.db'):
+    engine = create_sqlite_engine(db_path)
+    create_schema(engine)
     return engine
 
 def create_session(engine):
@@ -60,85 +156,160 @@ def create_session(engine):
 
 class DatabaseService:
     def __init__(self, db_path='email_assistant.db'):
-        self.engine = create_engine(f'sqlite:///{db_path}')
-        Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine)
+        self.db_path = db_path
+        self.engine = create_sqlite_engine(db_path)
+        create_schema(self.engine)
+        if db_path == ':memory:':
+            self.read_engine = self.engine
+        else:
+            self.read_engine = create_sqlite_engine(db_path, readonly=True)
+        # expire_on_commit=False keeps returned objects usable without a reload SELECT
+        self.SessionFactory = scoped_session(sessionmaker(bind=self.engine, expire_on_commit=False))
+        self.ReadSessionFactory = scoped_session(sessionmaker(bind=self.read_engine, expire_on_commit=False))
+        self._ai_cache_inserts = itertools.count(1)
         self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(logging.INFO)
-        if not logging.root.handlers:
-            handler = logging.StreamHandler()
-            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-            handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
         if not hasattr(self.__class__, '_logger_configured'):
-            self.logger = logging.getLogger(__name__)
             self.logger.setLevel(logging.INFO)
             handler = logging.StreamHandler()
             formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
             handler.setFormatter(formatter)
             self.logger.addHandler(handler)
             self.__class__._logger_configured = True 
+
+    @contextmanager
+    def _session(self, readonly=False):
+        # the thread's session is reused across calls; each call only ends its own transaction
+        factory = self.ReadSessionFactory if readonly else self.SessionFactory
+        session = factory()
+        try:
+            yield session
+            # hands the connection (and its WAL snapshot) back to the pool; nothing is expired
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            # returned objects are detached so later calls never see them stale from the identity map
+            session.expunge_all()
+
+    def remove_sessions(self):
+        """Close this thread's sessions; call once a task (menu action, request) is done"""
+        self.SessionFactory.remove()
+        self.ReadSessionFactory.remove()
+
     def get_calendar_event_by_google_id(self, google_event_id: str):
-        with self.Session() as session:
-            return session.query(CalendarEvent).filter(CalendarEvent.google_event_id == google_event_id).first()
+        with self._session(readonly=True) as session:
+            return session.execute(
+                select(CalendarEvent).where(CalendarEvent.google_event_id == google_event_id)
+            ).scalar_one_or_none()
 
     def update_calendar_event(self, event_id: str, new_start_time, new_end_time, new_description=None):
-        with self.Session() as session:
-            event = session.query(CalendarEvent).filter(CalendarEvent.id == event_id).first()
-            if event:
-                event.start_time = new_start_time
-                event.end_time = new_end_time
-                if new_description is not None:
-                    event.description = new_description
-                session.commit()
-                return True
-            return False
+        values = {'start_time': new_start_time, 'end_time': new_end_time}
+        if new_description is not None:
+            values['description'] = new_description
+        with self._session() as session:
+            result = session.execute(
+                update(CalendarEvent).where(CalendarEvent.id == event_id).values(**values)
+            )
+            session.commit()
+            return result.rowcount > 0
+
     def get_user(self, email: str):
-        with self.Session() as session:
-            return session.query(User).filter(User.email == email).first()
+        """{'id', 'email', 'google_token'} for the user, or None; callers get their own copy"""
+        key = (self.db_path, email)
+        cached = _user_cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return copy.deepcopy(cached[1])
+        with self._session(readonly=True) as session:
+            row = session.execute(
+                select(User.id, User.email, User.google_token).where(User.email == email)
+            ).first()
+        if row is None:
+            return None
+        user = row._asdict()
+        if len(_user_cache) >= USER_CACHE_MAXSIZE:
+            _user_cache.pop(next(iter(_user_cache)))
+        _user_cache[key] = (time.monotonic() + USER_CACHE_TTL, user)
+        return copy.deepcopy(user)
+
+    def _invalidate_user(self, email: str):
+        _user_cache.pop((self.db_path, email), None)
     
     def create_user(self, email: str, token_data: dict):
-        with self.Session() as session:
+        self._invalidate_user(email)
+        with self._session() as session:
             try:
                 user = User(email=email, google_token=token_data)
                 session.add(user)
                 session.commit()
-                return user
+                return {'id': user.id, 'email': user.email}
             except IntegrityError:
                 session.rollback()
                 return None
     
     def update_user_token(self, email: str, token_data: dict):
-        with self.Session() as session:
-            user = session.query(User).filter(User.email == email).first()
-            if user:
-                user.google_token = token_data
+        new_token = orjson.dumps(token_data).decode()
+        with self._session() as session:
+            # compare the stored text as-is instead of decoding it
+            stored = session.execute(
+                select(type_coerce(User.google_token, Text)).where(User.email == email)
+            ).first()
+            if stored is None:
+                return False
+            if stored[0] != new_token:
+                session.execute(update(User).where(User.email == email).values(google_token=token_data))
                 session.commit()
-                return True
-            return False
+                self._invalidate_user(email)
+            return True
     
+    @staticmethod
+    def _processed_email_values(email_data: dict) -> dict:
+        values = {
+            'id': email_data['id'],
+            'user_id': email_data['user_id'],
+            'thread_id': email_data.get('thread_id'),
+            'subject': email_data['subject'],
+            'from_email': email_data['from'],
+            'category': email_data['category'],
+            'actions': email_data['actions'],
+            'ai_response': email_data.get('ai_response', ''),
+            'snippet': email_data.get('snippet', ''),
+        }
+        # leave sent_at out when unknown so the column default applies
+        if email_data.get('sent_at') is not None:
+            values['sent_at'] = email_data['sent_at']
+        return values
+
+    @classmethod
+    def _build_processed_email(cls, email_data: dict) -> ProcessedEmail:
+        return ProcessedEmail(**cls._processed_email_values(email_data))
+
+    @staticmethod
+    def _build_calendar_event(event_data: dict) -> CalendarEvent:
+        return CalendarEvent(
+            user_id=event_data['user_id'],
+            email_id=event_data.get('email_id'),
+            title=event_data['title'],
+            start_time=event_data['start_time'],
+            end_time=event_data['end_time'],
+            attendees=event_data.get('attendees', []),
+            google_event_id=event_data.get('google_event_id'),
+            description=event_data.get('description', '')
+        )
+
     def log_processed_email(self, email_data: dict):
         try:
-            with self.Session() as session:
-                email = ProcessedEmail(
-                    id=email_data['id'],
-                    user_id=email_data['user_id'],
-                    thread_id=email_data.get('thread_id'),
-                    subject=email_data['subject'],
-                    from_email=email_data['from'],
-                    category=email_data['category'],
-                    actions=email_data['actions'],
-                    ai_response=email_data.get('ai_response', ''),
-                    snippet=email_data.get('snippet', ''),        
-                    sent_at=email_data.get('sent_at')                
-                )
-                session.add(email)
+            with self._session() as session:
+                stmt = sqlite_insert(ProcessedEmail).values(
+                    **self._processed_email_values(email_data)
+                ).on_conflict_do_nothing(index_elements=['id'])
+                result = session.execute(stmt)
                 session.commit()
+                if result.rowcount == 0:
+                    self.logger.warning(f"Duplicate email detected: {email_data['id']}")
+                    return False
                 self.logger.info(f"Logged email ID: {email_data['id']}")
-                
-        except IntegrityError as e:
-            self.logger.warning(f"Duplicate email detected: {email_data['id']}")
-            session.rollback()
+                return True
             
         except SQLAlchemyError as e:
             self.logger.error(f"Database error logging email {email_data['id']}: {str(e)}")
@@ -151,18 +322,9 @@ class DatabaseService:
             raise
     
     def log_calendar_event(self, event_data: dict):
-        with self.Session() as session:
+        with self._session() as session:
             try:
-                event = CalendarEvent(
-                    user_id=event_data['user_id'],
-                    email_id=event_data.get('email_id'),
-                    title=event_data['title'],
-                    start_time=event_data['start_time'],
-                    end_time=event_data['end_time'],
-                    attendees=event_data.get('attendees', []),
-                    google_event_id=event_data.get('google_event_id'),
-                    description=event_data.get('description', '')
-                )
+                event = self._build_calendar_event(event_data)
                 session.add(event)
                 session.commit()
                 self.logger.info(f"✅ Calendar event saved: {event.google_event_id}")
@@ -171,32 +333,98 @@ class DatabaseService:
                 self.logger.error(f"❌ Failed to save calendar event: {e}")
                 raise
         
+    def log_processed_emails_bulk(self, emails_data: list) -> int:
+        """Insert many processed emails in one transaction, skipping duplicates"""
+        if not emails_data:
+            return 0
+        with self._session() as session:
+            try:
+                existing = self._existing_email_ids(session, [e['id'] for e in emails_data])
+                new_emails = []
+                for email_data in emails_data:
+                    if email_data['id'] in existing:
+                        self.logger.warning(f"Duplicate email detected: {email_data['id']}")
+                        continue
+                    existing.add(email_data['id'])
+                    new_emails.append(self._build_processed_email(email_data))
+                session.add_all(new_emails)
+                session.commit()
+                self.logger.info(f"Logged {len(new_emails)} emails")
+                return len(new_emails)
+            except SQLAlchemyError as e:
+                session.rollback()
+                self.logger.error(f"Database error logging {len(emails_data)} emails: {str(e)}")
+                raise
+
+    @staticmethod
+    def _existing_email_ids(session, ids: list) -> set:
+        existing = set()
+        # chunked to stay under SQLite's bound-parameter limit
+        for i in range(0, len(ids), SQLITE_IN_CHUNK):
+            chunk = ids[i:i + SQLITE_IN_CHUNK]
+            existing.update(
+                row[0] for row in session.execute(select(ProcessedEmail.id).where(ProcessedEmail.id.in_(chunk)))
+            )
+        return existing
+
+    def filter_unprocessed(self, ids: list) -> list:
+        """Return the ids (in order) that have no processed_emails row yet"""
+        if not ids:
+            return []
+        with self._session(readonly=True) as session:
+            existing = self._existing_email_ids(session, ids)
+        return [i for i in ids if i not in existing]
+
     def email_already_processed(self, email_id: str):
-        with self.Session() as session:
-            return session.query(ProcessedEmail).filter(
-                ProcessedEmail.id == email_id
-            ).first() is not None
+        with self._session(readonly=True) as session:
+            return session.execute(
+                select(select(ProcessedEmail.id).where(ProcessedEmail.id == email_id).exists())
+            ).scalar()
         
     def get_calendar_event_by_thread(self, thread_id: str):
-        with self.Session() as session:
-            original_email = session.query(ProcessedEmail).filter(
-                ProcessedEmail.thread_id == thread_id,
-                ProcessedEmail.category == 'meeting'
-            ).order_by(ProcessedEmail.sent_at.asc()).first()
-            
-            if original_email:
-                return session.query(CalendarEvent).filter(
-                    CalendarEvent.email_id == original_email.id
-                ).first()
-            return None
+        with self._session(readonly=True) as session:
+            return session.execute(
+                select(CalendarEvent)
+                .join(ProcessedEmail, CalendarEvent.email_id == ProcessedEmail.id)
+                .where(
+                    ProcessedEmail.thread_id == thread_id,
+                    ProcessedEmail.category == 'meeting'
+                )
+                .order_by(ProcessedEmail.sent_at.asc())
+                .limit(1)
+            ).scalars().first()
+
+    def get_calendar_events_by_threads(self, thread_ids: list) -> dict:
+        """Batched get_calendar_event_by_thread: {thread_id: CalendarEvent} for threads that have one"""
+        events = {}
+        if not thread_ids:
+            return events
+        with self._session(readonly=True) as session:
+            for i in range(0, len(thread_ids), SQLITE_IN_CHUNK):
+                rows = session.execute(
+                    select(ProcessedEmail.thread_id, CalendarEvent)
+                    .join(ProcessedEmail, CalendarEvent.email_id == ProcessedEmail.id)
+                    .where(
+                        ProcessedEmail.thread_id.in_(thread_ids[i:i + SQLITE_IN_CHUNK]),
+                        ProcessedEmail.category == 'meeting'
+                    )
+                    .order_by(ProcessedEmail.thread_id, ProcessedEmail.sent_at.asc())
+                )
+                for thread_id, event in rows:
+                    events.setdefault(thread_id, event)
+        return events
+
     def update_calendar_event_time(self, event_id: str, new_start_time: datetime, new_end_time: datetime) -> bool:
-        with self.Session() as session:
+        with self._session() as session:
             try:
-                event = session.query(CalendarEvent).filter(CalendarEvent.id == event_id).first()
-                if event:
-                    event.start_time = new_start_time
-                    event.end_time = new_end_time
-                    session.commit()
+                result = session.execute(
+                    update(CalendarEvent).where(CalendarEvent.id == event_id).values(
+                        start_time=new_start_time,
+                        end_time=new_end_time
+                    )
+                )
+                session.commit()
+                if result.rowcount > 0:
                     self.logger.info(f"Updated calendar event: {event_id}")
                     return True
                 return False
@@ -209,7 +437,7 @@ class DatabaseService:
                 self.logger.critical(f"Unexpected error updating event: {str(e)}", exc_info=True)
                 return False
     def log_sent_email(self, email_data: dict):
-        with self.Session() as session:
+        with self._session() as session:
             try:
                 sent_email = SentEmail(
                     user_id=email_data['user_id'],
@@ -228,6 +456,34 @@ class DatabaseService:
                 session.rollback()
                 return False
 
+    def get_cached_ai_response(self, key: str, max_age: int = None):
+        query = select(AIResponse.response).where(AIResponse.key == key)
+        if max_age:
+            # created_at holds SQLite's CURRENT_TIMESTAMP text, so compare against the same format
+            query = query.where(AIResponse.created_at >= func.datetime('now', f'-{int(max_age)} seconds'))
+        with self._session(readonly=True) as session:
+            return session.execute(query).scalar_one_or_none()
+
+    def cache_ai_response(self, key: str, response: str, max_entries: int = None):
+        with self._session() as session:
+            stmt = sqlite_insert(AIResponse).values(key=key, response=response)
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=['key'],
+                set_={'response': stmt.excluded.response, 'created_at': func.now()}
+            ))
+            # eviction walks the created_at index on the writer connection, so it runs only now and then
+            if max_entries and next(self._ai_cache_inserts) % AI_CACHE_PRUNE_EVERY == 0:
+                cutoff = (
+                    select(AIResponse.created_at)
+                    .order_by(AIResponse.created_at.desc())
+                    .offset(max_entries)
+                    .limit(1)
+                    .scalar_subquery()
+                )
+                # strictly older: rows stamped in the cutoff's second stay rather than all going at once
+                session.execute(delete(AIResponse).where(AIResponse.created_at < cutoff))
+            session.commit()
+
 class EmailThread(Base):
     __tablename__ = 'email_threads'
     id = Column(String, primary_key=True)  
@@ -236,18 +492,25 @@ class EmailThread(Base):
     last_processed = Column(DateTime)
 class SentEmail(Base):
     __tablename__ = 'sent_emails'
-    id = Column(String(50), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String(50), primary_key=True, default=random_hex_id(), server_default=HEX_ID_SERVER_DEFAULT)
     user_id = Column(Integer, ForeignKey('users.id'))
     thread_id = Column(String(100))
     message_id = Column(String(100))
     recipient = Column(String(255))
     subject = Column(String(255))
     body = Column(Text)
-    sent_at = Column(DateTime, default=lambda: datetime.datetime.utcnow()) 
+    sent_at = Column(DateTime, default=func.now(), server_default=func.now())
     context = Column(Text)
     
     def __repr__(self):
         return f"<SentEmail(to={self.recipient}, subject={self.subject[:20]}...)>"
+
+class AIResponse(Base):
+    __tablename__ = 'ai_responses'
+    key = Column(String(64), primary_key=True)  # sha256 of model + prompt
+    response = Column(Text)
+    created_at = Column(DateTime, server_default=func.now(), index=True)
+
 if __name__ == "__main__":
     print("Initializing database...")
     engine = init_db()
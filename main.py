@@ -2,63 +2,444 @@ import os
 import sys
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 import requests
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
-import json
+import orjson
 import re
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.model import JsonModel
 from typing import List, Dict
 import base64
-import pytz
-import dateparser
-from dateutil import parser, tz
+import shlex
+import subprocess
+import tempfile
+from bisect import bisect_left
+from itertools import chain, islice
+import functools
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import httplib2
+import google_auth_httplib2
 from typing import Optional, Dict, List 
 from database import DatabaseService
 from urllib.parse import urlparse, parse_qs
-from dateparser import parse
-from dateparser.conf import settings
 from email.utils import parsedate_to_datetime
-DUBAI_TIMEZONE = pytz.timezone('Asia/Dubai')
+logger = logging.getLogger(__name__)
+DUBAI_TZ_NAME = 'Asia/Dubai'
+DUBAI_TIMEZONE = ZoneInfo(DUBAI_TZ_NAME)
+MEETING_TIME_FORMAT = '%A, %B %d at %I:%M %p'  # how meeting times are shown to the user and in replies
 
 load_dotenv()
 
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 API_URL = "https://api.deepseek.com/v1/chat/completions"
+AI_MODEL = "deepseek-chat"
+AI_TEMPERATURE = 0.7
+AI_MAX_TOKENS = 1000
+# Fixed instructions go in the system turn and the per-email data in the user turn, so the
+# request prefix is byte-identical across calls and hits DeepSeek's prompt-prefix cache.
+COMPOSE_SYSTEM_PROMPT = "Write a professional email about the topic the user gives."
+REPLY_SYSTEM_PROMPT = (
+    "Compose a professional email response to the message the user provides.\n"
+    "Response should:\n"
+    "- Be polite and professional\n"
+    "- Address all points in the original email\n"
+    "- Keep it concise (3-5 sentences max)\n"
+    "- Include a proper greeting and closing"
+)
+EDIT_SYSTEM_PROMPT = (
+    "Revise the email the user provides based on their instructions. "
+    "Reply with the revised email only, without any additional explanations or formatting."
+)
+LATEST_TIME_SYSTEM_PROMPT = (
+    "Extract meeting time ONLY from the MOST RECENT message in the email the user provides. "
+    "Ignore any quoted/forwarded content or previous messages. Respond ONLY with:\n"
+    "- ISO 8601 format (YYYY-MM-DDTHH:MM:SS) in Asia/Dubai timezone\n"
+    '- "none" if no time found in the new message'
+)
+MEETING_TIME_SYSTEM_PROMPT = (
+    "What is the exact meeting date and time mentioned in the email the user provides? "
+    "Respond ONLY in ISO 8601 format (YYYY-MM-DDTHH:MM:SS) for Asia/Dubai timezone. "
+    "If no time is mentioned, return 'none'."
+)
+BATCH_TIME_SYSTEM_PROMPT = (
+    "The user provides a JSON array of emails, each with an index. For every email extract the meeting "
+    "time ONLY from its MOST RECENT message, ignoring quoted/forwarded content. Respond ONLY with a JSON "
+    'array of objects {"index": <index>, "time": <value>} where value is ISO 8601 (YYYY-MM-DDTHH:MM:SS) '
+    'in Asia/Dubai timezone, or "none" if no time is found.'
+)
+ORIGINAL_TIME_SLOT = "{original_time}"
+ALTERNATIVE_TIMES_SLOT = "{alternative_times}"
+AI_CACHE_MAXSIZE = 1024
+AI_CACHE_TTL = 7 * 24 * 3600  # seconds; cached answers older than a week are asked again
+_ai_memory_cache = OrderedDict()  # in-process tier in front of the ai_responses table
+
+# one keep-alive session so DeepSeek calls reuse the TLS connection instead of handshaking each time
+_ai_session = requests.Session()
+_ai_session.headers.update({
+    "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
+    "Content-Type": "application/json",
+    "Accept": "application/json"
+})
+# connection failures (e.g. a pooled connection the server already closed) are retried; POSTs
+# that reached the server are not, since urllib3 never retries non-idempotent methods on read errors
+_ai_session.mount("https://", requests.adapters.HTTPAdapter(
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.3)
+))
+GMAIL_BATCH_LIMIT = 100  # max sub-requests per Gmail batch call
+GMAIL_FETCH_WORKERS = 8
+CALENDAR_PROBE_WORKERS = 8
+AI_DETECT_BATCH_SIZE = 10  # meeting emails per time-detection call
+EMAIL_CACHE_MAXSIZE = 256  # message bodies are immutable, so revisits are served from memory
+PROFILE_CACHE_TTL = 300
+SYNC_STATE_FILE = '.sync_state.json'  # last Gmail historyId the inbox was fully reviewed up to
+# partial response: only the parts of the message get_email_content actually reads
+_PART_FIELDS = 'mimeType,body(data,size)'
+GMAIL_CONTENT_FIELDS = (
+    f'id,threadId,payload(headers(name,value),{_PART_FIELDS},'
+    f'parts({_PART_FIELDS},parts({_PART_FIELDS},parts({_PART_FIELDS}))))'
+)
+MAX_TEXT_PART_SIZE = 1_000_000  # bigger text/plain parts are attachments, not the message body
+PROPOSAL_HOURS = (9, 11, 14, 16)
+PROPOSAL_SEARCH_DAYS = 7
+# Candidate offsets from "now" when proposing a fresh slot, in the order they are tried
+PROPOSAL_OFFSETS = tuple(
+    timedelta(days=day, hours=hour)
+    for day in range(PROPOSAL_SEARCH_DAYS)
+    for hour in PROPOSAL_HOURS
+)
 SCOPES = [
     "https://www.googleapis.com/auth/gmail.send",
     "https://www.googleapis.com/auth/gmail.readonly", 
     "https://www.googleapis.com/auth/calendar.events"
 ]
 
+
+def _trie_pattern(phrases) -> str:
+    """Regex source for the phrases factored into a prefix trie.
+
+    Shared prefixes are tested once per position instead of once per phrase, which gets a
+    plain `re` search close to a single automaton pass.
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase.lower():
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def walk(node) -> str:
+        branches = [re.escape(ch) + walk(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            return '(?:' + body + ')?'
+        return body
+
+    return walk(trie)
+
+
+def _phrase_re(phrases) -> re.Pattern:
+    """Compile a case-insensitive pattern that matches any of the given substrings."""
+    return re.compile(_trie_pattern(phrases), re.IGNORECASE)
+
+
+# (rule, keywords, overrides) in precedence order: the first rule with a hit wins
+CLASSIFY_RULES = (
+    ("gratitude", ["thank", "appreciate", "grateful"], {"category": "gratitude", "emotional_tone": "positive"}),
+    ("meeting", ["meeting", "call", "schedule"], {"category": "meeting"}),
+    ("celebration", ["birthday", "anniversary", "congrats"], {"category": "celebration", "emotional_tone": "positive"}),
+    ("urgent", ["urgent", "asap", "important"], {"priority": "urgent", "suggested_response_time": "1h"}),
+)
+CLASSIFY_RE = re.compile(
+    "|".join(f"(?P<{rule}>{_phrase_re(keywords).pattern})" for rule, keywords, _ in CLASSIFY_RULES),
+    re.IGNORECASE
+)
+
+MEETING_PHRASES = frozenset([
+    # Core meeting terms
+    "meet", "meeting", "gathering", "appointment", "session", "conference", "consultation",
+
+    # Scheduling terms
+    "schedule", "book a", "set up", "arrange", "plan a", "organize", "coordinate",
+
+    # Time-specific terms
+    "catch up", "touch base", "sync up", "check in", "follow up", "get together", "reconnect",
+
+    # Activity-based terms
+    "grab coffee", "lunch meeting", "dinner meeting", "video call", "zoom call", "teams meeting",
+    "google meet", "call", "chat", "discuss", "talk", "brainstorm", "review", "briefing",
+    "workshop", "presentation", "demo", "walkthrough",
+
+    # Confirmation terms
+    "confirm our", "still on", "are we still", "following up", "checking in", "reminder about",
+    "as agreed", "as discussed", "as planned",
+
+    # Location-based terms
+    "in person", "face to face", "at the office", "remotely", "virtually",
+
+    # Invitation terms
+    "invite you", "join us", "would you be available", "are you free", "are you available",
+    "let's connect", "can we", "could we", "would you like to", "suggest we",
+
+    # Formal terms
+    "interview", "negotiation", "mediation", "assessment", "evaluation", "training", "onboarding"
+])
+
+# Common false positives to exclude
+MEETING_EXCLUDE_PHRASES = frozenset([
+    "meeting room", "meeting rooms", "meeting point", "meeting place", "meeting link",
+    "meeting id", "meeting password", "meeting agenda", "meeting minutes", "meeting notes",
+    "meeting recording", "meeting schedule", "meeting request", "meeting invitation"
+])
+
+RESCHEDULE_KEYWORDS = frozenset([
+    'reschedule', 're-schedule', 'rearrange', 'change time',
+    'move', 'postpone', 'new time', 'different time', 'adjust',
+    'push back', 'push forward', 'shift', 'relocate', 'change our meeting',
+    'alternate time', 'rescheduling', 'replan', 're-book'
+])
+
+MEETING_RE = _phrase_re(MEETING_PHRASES)
+MEETING_EXCLUDE_RE = _phrase_re(MEETING_EXCLUDE_PHRASES)
+RESCHEDULE_RE = _phrase_re(RESCHEDULE_KEYWORDS)
+
+NLP_TIME_PATTERNS = [
+    re.compile(r'(tomorrow) at (\d{1,2}(?::\d{2})?\s*(?:am|pm)?)', re.IGNORECASE),  # "tomorrow at 10pm"
+    re.compile(r'at (\d{1,2}(?::\d{2})?\s*(?:am|pm)?)\s*(tomorrow)', re.IGNORECASE),  # "at 10pm tomorrow"
+    re.compile(r'next (\w+day)\s*at (\d{1,2}(?::\d{2})?\s*(?:am|pm)?)', re.IGNORECASE),  # "next friday at 8pm"
+    re.compile(r'\b(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2})?)'),  # "2025-03-14 15:30"
+    re.compile(r'\b((?:mon|tue|wed|thu|fri|sat|sun)[a-z]*)\s+(?:at\s+)?(\d{1,2}(?::\d{2})?\s*(?:am|pm))\b', re.IGNORECASE)  # "friday 3pm"
+]
+EDIT_TIME_INSTRUCTION_RE = re.compile(
+    r'(?:change|move|set|update)\s+(?:the\s+)?(?:meeting\s+)?time\s+to\s+(\d{1,2}(?::\d{2})?\s*(?:am|pm))\.?',
+    re.IGNORECASE
+)
+DRAFT_TIME_RE = re.compile(r'\b\d{1,2}(?::\d{2})?\s*(?:[ap]\.m\.|[ap]m\b)', re.IGNORECASE)
+EMAIL_DATE_RE = re.compile(r'(\d{1,2} [а-я]+\. \d{4} г\. в \d{1,2}:\d{2})')  # Gmail's Russian quote header date
+GREETING_BODY_RE = re.compile(r'hey Kristina! (.+)')
+ANGLE_EMAIL_RE = re.compile(r'<([^>]+)>')  # address part of "Name <user@host>"
+EMAIL_ADDRESS_RE = re.compile(r'[^\s@]+@[^\s@]+\.[^\s@]+')  # loose shape check: one @, a dot in the domain, no spaces
+NON_ISO_CHARS_RE = re.compile(r'[^0-9T:\-]+')  # runs, so each stretch of junk is one match
+ISO_SPACE_RE = re.compile(r'(\d{4}-\d{2}-\d{2}) (\d{2}:\d{2}:\d{2})')
+MANUAL_TIME_RE = re.compile(r'(\d{1,2}:\d{2}\s*(?:am|pm)?)', re.IGNORECASE)
+MANUAL_DAY_RE = re.compile(r'(mon|tue|wed|thu|fri|sat|sun)', re.IGNORECASE)
+
+# "[next] <day> [at] H[:MM] [am|pm]" or "H[:MM] [am|pm] <day>", day being today/tomorrow/a weekday
+FAST_TIME_RE = re.compile(
+    r'(?:next\s+)?(?:(?P<day>[a-z]+)\s+)?(?:at\s+)?'
+    r'(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<ampm>am|pm)?'
+    r'(?:\s+(?P<day_after>[a-z]+))?',
+    re.IGNORECASE
+)
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+SIGN_OFF_WORDS = ("sincerely", "sincerely,", "regards", "regards,", "best", "best,")
+
+QUOTE_PATTERNS = (
+    r"On .* wrote:",  # English
+    r"Le .* \u00E9crit :",  # French
+    r"El .* escribi\u00F3:",  # Spanish
+    r"\d{4}-\d{2}-\d{2} \d{2}:\d{2} .* <.*>:",  # Email headers
+    r"From: .*",  # Email headers
+    r"-----Original Message-----",
+    r"_{10,}",  # Lines of underscores
+    r"\-{10,}",  # Lines of dashes
+    r"Sent from my .*",  # Signatures
+)
+QUOTE_RE = re.compile("|".join(QUOTE_PATTERNS), re.IGNORECASE)
+QUOTE_SPLIT_RE = re.compile(r"^(.*?)(?:" + "|".join(QUOTE_PATTERNS) + ")", re.DOTALL | re.IGNORECASE)
+
+SUMMARY_PREFIX_RE = re.compile(r'^Summary:\s*')
+WHITESPACE_RE = re.compile(r'\s+')
+
+GENERATED_EMAIL_PREFIXES = (
+    "Here's a polished and professional email you could use",
+    "Below is a professional email template",
+    "Here is a professional email draft",
+    "Certainly! Below is a polite and professional email template",
+    "Here’s a polished and professional email",
+    "Here's a professional email draft",
+)
+
+GENERATED_EMAIL_PREFIX_RE = re.compile("|".join(re.escape(p) for p in GENERATED_EMAIL_PREFIXES))
+
+GENERATED_EMAIL_FOOTERS = (
+    "Optional Additions:",
+    "Customization Tips:",
+    "Notes:",
+    "Adjust based on",
+    "Let me know if you'd like any adjustments",
+    "Feel free to customize",
+    "You can adjust"
+)
+GENERATED_EMAIL_FOOTER_RE = re.compile("|".join(re.escape(p) for p in GENERATED_EMAIL_FOOTERS))
+
+# One pass over the draft: **Subject:** -> "Subject: ", **bold** -> bold, heading hashes dropped
+MARKDOWN_RE = re.compile(r"(?P<subject>\*{2}Subject:\*{2}\s*)|\*{2}(?P<bold>.*?)\*{2}|#{2,}\s*")
+
+
+def _markdown_repl(match: re.Match) -> str:
+    if match.group('subject'):
+        return "Subject: "
+    return match.group('bold') or ""
+
+BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+@functools.lru_cache(maxsize=1024)
+def _mentions_meeting(text: str) -> bool:
+    # memoized: the inbox prefetch and the review loop both ask about the same subject and body
+    return bool(MEETING_RE.search(text)) and not MEETING_EXCLUDE_RE.search(text)
+
+
+BANNER = "=" * 50
+
+
+def print_block(title: str, body: str):
+    # one write per block instead of four
+    print(f"{title}\n{BANNER}\n{body}\n{BANNER}")
+
+
+def _parse_iso(text: str) -> Optional[datetime]:
+    try:
+        dt = datetime.fromisoformat(text.strip())
+    except ValueError:
+        return None
+    return dt.replace(tzinfo=DUBAI_TIMEZONE) if dt.tzinfo is None else dt
+
+
+def _fast_parse_time(text: str, now: datetime) -> Optional[datetime]:
+    """Parse the few shapes the meeting detectors produce without going through dateparser.
+
+    Returns None for anything outside that grammar so the caller can fall back to dateparser.
+    """
+    dt = _parse_iso(text)
+    if dt:
+        return dt
+    
+    match = FAST_TIME_RE.fullmatch(text.strip())
+    if not match or (match.group('day') and match.group('day_after')):
+        return None
+    
+    hour, minute = int(match.group('hour')), int(match.group('minute') or 0)
+    ampm = (match.group('ampm') or '').lower()
+    if ampm:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if ampm == 'pm' else 0)
+    if hour > 23 or minute > 59:
+        return None
+    
+    day = (match.group('day') or match.group('day_after') or 'today').lower()
+    if day == 'today':
+        days_ahead = 0
+    elif day == 'tomorrow':
+        days_ahead = 1
+    else:
+        weekday = next((i for i, name in enumerate(WEEKDAYS) if len(day) >= 3 and name.startswith(day)), None)
+        if weekday is None:
+            return None
+        # like dateparser's PREFER_DATES_FROM='future': the weekday of today means next week
+        days_ahead = (weekday - now.weekday()) % 7 or 7
+    
+    date = (now + timedelta(days=days_ahead)).date()
+    return datetime(date.year, date.month, date.day, hour, minute, tzinfo=DUBAI_TIMEZONE)
+
+
+class OrjsonModel(JsonModel):
+    """JsonModel that decodes Google API responses with orjson."""
+
+    def deserialize(self, content):
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return content.decode('utf-8') if isinstance(content, bytes) else content
+        if self._data_wrapper and "data" in body:
+            body = body["data"]
+        return body
+
+
+@functools.lru_cache(maxsize=1)
+def get_credentials() -> Credentials:
+    """Load (refreshing or re-authorizing if needed) the OAuth credentials shared by the Gmail and Calendar clients."""
+    creds = None
+    if os.path.exists('token.json'):
+        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+    
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            flow = InstalledAppFlow.from_client_secrets_file(
+                'credentials.json', SCOPES)
+            creds = flow.run_local_server(port=0)
+        
+        with open('token.json', 'w') as token:
+            token.write(creds.to_json())
+
+    return creds
+
+
+def thread_local_http(local: threading.local, creds):
+    # httplib2 connections are not thread-safe, so every thread gets its own
+    http = getattr(local, 'http', None)
+    if http is None:
+        http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http())
+        local.http = http
+    return http
+
+
+@functools.lru_cache(maxsize=None)
+def _discovery_text(service_name: str, version: str) -> str:
+    # bundled with google-api-python-client, read once per process
+    return get_static_doc(service_name, version)
+
+
+def _discovery_document(service_name: str, version: str) -> dict:
+    # build_from_document fills in the dict it is given, so every build parses its own
+    return orjson.loads(_discovery_text(service_name, version))
+
+
+def build_service(service_name: str, version: str):
+    return build_from_document(
+        _discovery_document(service_name, version),
+        credentials=get_credentials(),
+        model=OrjsonModel()
+    )
+
+
 class EmailClassifier:
+    def __init__(self, db: Optional[DatabaseService] = None):
+        self.db = db or DatabaseService()
+
     def classify_email(self, query: str) -> dict:
-        query_lower = query.lower()
-        category = "general"
-        emotional_tone = "neutral"
-        priority = "normal"
-        suggested_response_time = "24h"
-        
-        if any(word in query_lower for word in ["thank", "appreciate", "grateful"]):
-            category = "gratitude"
-            emotional_tone = "positive"
-        elif any(word in query_lower for word in ["meeting", "call", "schedule"]):
-            category = "meeting"
-        elif any(word in query_lower for word in ["birthday", "anniversary", "congrats"]):
-            category = "celebration"
-            emotional_tone = "positive"
-        elif any(word in query_lower for word in ["urgent", "asap", "important"]):
-            priority = "urgent"
-            suggested_response_time = "1h"
-        
-        return {
-            "category": category,
-            "emotional_tone": emotional_tone,
-            "priority": priority,
-            "suggested_response_time": suggested_response_time
+        result = {
+            "category": "general",
+            "emotional_tone": "neutral",
+            "priority": "normal",
+            "suggested_response_time": "24h"
         }
+        
+        # one scan collects every rule that fired, precedence is applied afterwards
+        hits = {match.lastgroup for match in CLASSIFY_RE.finditer(query)}
+        for rule, _, overrides in CLASSIFY_RULES:
+            if rule in hits:
+                result.update(overrides)
+                break
+        
+        return result
     def summarize_meeting(self, email_body: str) -> str:
         prompt = f"""Summarize this meeting request into a concise 1-2 sentence description focusing on:
         - Purpose of meeting
@@ -70,66 +451,93 @@ class EmailClassifier:
         
         try:
             summary = self._call_ai_api(prompt)
-            summary = re.sub(r'^Summary:\s*', '', summary)  
-            summary = re.sub(r'\s+', ' ', summary).strip()  
+            summary = SUMMARY_PREFIX_RE.sub('', summary)  
+            summary = WHITESPACE_RE.sub(' ', summary).strip()  
             return summary[:500]  
         except Exception as e:
             print(f"⚠️ Summary generation failed: {str(e)}")
             return "Meeting scheduled via email"  
-    def _call_ai_api(self, prompt: str) -> str:
-        headers = {
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
-        
+    def _get_cached_response(self, key: str) -> Optional[str]:
+        entry = _ai_memory_cache.get(key)
+        if entry is not None:
+            expires, response = entry
+            if time.monotonic() < expires:
+                _ai_memory_cache.move_to_end(key)
+                return response
+            del _ai_memory_cache[key]
+        try:
+            response = self.db.get_cached_ai_response(key, max_age=AI_CACHE_TTL)
+        except Exception as e:
+            print(f"⚠️ AI cache lookup failed: {str(e)}")
+            return None
+        if response is not None:
+            self._remember_response(key, response)
+        return response
+
+    def _remember_response(self, key: str, response: str):
+        _ai_memory_cache[key] = (time.monotonic() + AI_CACHE_TTL, response)
+        _ai_memory_cache.move_to_end(key)
+        if len(_ai_memory_cache) > AI_CACHE_MAXSIZE:
+            _ai_memory_cache.popitem(last=False)
+
+    def _call_ai_api(self, prompt: str, use_cache: bool = True, system: Optional[str] = None) -> str:
         payload = {
-            "model": "deepseek-chat",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.7,
-            "max_tokens": 1000
+            "model": AI_MODEL,
+            "messages": ([{"role": "system", "content": system}] if system else [])
+                        + [{"role": "user", "content": prompt}],
+            "temperature": AI_TEMPERATURE,
+            "max_tokens": AI_MAX_TOKENS
         }
+        body = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+
+        # identical requests (model, prompt and sampling settings) are answered from the cache;
+        # use_cache=False forces a fresh completion
+        key = hashlib.sha256(body).hexdigest()
+        if use_cache:
+            cached = self._get_cached_response(key)
+            if cached is not None:
+                return cached
 
         try:
-            response = requests.post(API_URL, headers=headers, json=payload, timeout=30)
+            response = _ai_session.post(API_URL, data=body, timeout=30)
             response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
+            content = orjson.loads(response.content)["choices"][0]["message"]["content"]
         except Exception as e:
             print(f"API Error: {str(e)}")
             return ""
 
+        if content:
+            self._remember_response(key, content)
+            try:
+                self.db.cache_ai_response(key, content, max_entries=AI_CACHE_MAXSIZE)
+            except Exception as e:
+                print(f"⚠️ Failed to cache AI response: {str(e)}")
+        return content
+
 class GmailClient:
-    def __init__(self):
+    def __init__(self, db: Optional[DatabaseService] = None):
+        self.db = db or DatabaseService()
+        self._local = threading.local()
+        self._content_cache = OrderedDict()
+        self._content_lock = threading.Lock()
+        self._profile = None
+        self._profile_expires = 0.0
         self.service = self._authenticate()
     
     def _authenticate(self):
-        creds = None
-        db = DatabaseService()
-        if os.path.exists('token.json'):
-            creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-        
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    'credentials.json', SCOPES)
-                creds = flow.run_local_server(port=0)
-            
-            with open('token.json', 'w') as token:
-                token.write(creds.to_json())
-        
-        service = build('gmail', 'v1', credentials=creds)
+        self.creds = get_credentials()
+        service = build_service('gmail', 'v1')
+        self.service = service
         
-        profile = service.users().getProfile(userId='me').execute()
-        user_email = profile['emailAddress']
-        token_data = json.loads(creds.to_json())
+        profile = self.get_profile()
+        self.user_email = profile['emailAddress']
+        token_data = orjson.loads(self.creds.to_json())
         
-        user = db.get_user(user_email)
+        user = self.db.get_user(self.user_email)
         if user:
-            db.update_user_token(user_email, token_data)
+            self.db.update_user_token(self.user_email, token_data)
         else:
-            db.create_user(user_email, token_data)
+            self.db.create_user(self.user_email, token_data)
 
         return service
         
@@ -146,36 +554,123 @@ class GmailClient:
                 maxResults=max_results
             ).execute()
             
-            messages = results.get('messages', [])
-            email_data = []
+            return self._get_emails_metadata([msg['id'] for msg in results.get('messages', [])])
             
-            for msg in messages:
-                msg_detail = self.service.users().messages().get(
+        except Exception as error:
+            print(f"Error fetching emails: {str(error)}")
+            return []
+
+    def get_emails_since(self, history_id: str, max_results=50) -> Optional[tuple]:
+        """Inbox emails added after history_id (newest first) and the history id to resume from.
+
+        When more than max_results arrived, whole history records are returned oldest first up to that
+        limit and the resume point is the last record taken, so the rest are listed on the next sync.
+        Returns None when Gmail no longer has that history, so the caller can fall back to a full query.
+        """
+        try:
+            records = []  # (history record id, message ids it added), oldest first
+            latest_history_id = history_id
+            page_token = None
+            while True:
+                response = self.service.users().history().list(
                     userId='me',
-                    id=msg['id'],
-                    format='metadata',
-                    metadataHeaders=['From', 'To', 'Subject']
+                    startHistoryId=history_id,
+                    historyTypes=['messageAdded'],
+                    labelId='INBOX',
+                    pageToken=page_token
                 ).execute()
-                
-                headers = msg_detail.get("payload", {}).get("headers", [])
-                from_email = next((h['value'] for h in headers if h['name'] == 'From'), '')
-                to_email = next((h['value'] for h in headers if h['name'] == 'To'), '')
-                subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-                
-                email_data.append({
-                    'id': msg['id'],
-                    'from': from_email,
-                    'to': to_email,
-                    'subject': subject,
-                    'snippet': msg_detail.get('snippet', '')
-                })
-            
-            return email_data
+                for record in response.get('history', []):
+                    added = [m['message']['id'] for m in record.get('messagesAdded', [])]
+                    if added:
+                        records.append((record['id'], added))
+                latest_history_id = response.get('historyId', latest_history_id)
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    break
             
+            message_ids = []
+            for index, (record_id, added) in enumerate(records):
+                # only cut between records: the next sync starts after the resume record, so
+                # messages it added but that were left out would never be listed again
+                if message_ids and len(message_ids) + len(added) > max_results:
+                    latest_history_id = records[index - 1][0]
+                    break
+                message_ids.extend(added)
+            newest_first = list(dict.fromkeys(reversed(message_ids)))
+            return self._get_emails_metadata(newest_first), latest_history_id
+        
         except Exception as error:
-            print(f"Error fetching emails: {str(error)}")
-            return []
+            print(f"Incremental sync unavailable, falling back to a full scan: {str(error)}")
+            return None
+
+    def load_history_id(self) -> Optional[str]:
+        try:
+            with open(SYNC_STATE_FILE, 'rb') as f:
+                return orjson.loads(f.read()).get('historyId')
+        except (OSError, ValueError):
+            return None
+
+    def save_history_id(self, history_id: str):
+        try:
+            with open(SYNC_STATE_FILE, 'wb') as f:
+                f.write(orjson.dumps({'historyId': history_id}))
+        except OSError as e:
+            print(f"⚠️ Failed to save sync state: {str(e)}")
+
+    def _get_emails_metadata(self, message_ids: List[str]) -> List[Dict[str, str]]:
+        details = {}
+        
+        def _collect(request_id, response, exception):
+            if exception is not None:
+                print(f"Error fetching email {request_id}: {str(exception)}")
+                return
+            details[request_id] = response
+        
+        def _run_batch(chunk_ids: List[str]):
+            batch = self.service.new_batch_http_request(callback=_collect)
+            for message_id in chunk_ids:
+                batch.add(
+                    self.service.users().messages().get(
+                        userId='me',
+                        id=message_id,
+                        format='metadata',
+                        metadataHeaders=['From', 'To', 'Subject']
+                    ),
+                    request_id=message_id
+                )
+            batch.execute(http=self._thread_http())
+        
+        # one HTTP round trip per batch instead of one per message; larger listings send their batches concurrently
+        chunks = [message_ids[start:start + GMAIL_BATCH_LIMIT] for start in range(0, len(message_ids), GMAIL_BATCH_LIMIT)]
+        if len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=min(GMAIL_FETCH_WORKERS, len(chunks))) as pool:
+                list(pool.map(_run_batch, chunks))
+        elif chunks:
+            _run_batch(chunks[0])
+        
+        email_data = []
+        for message_id in message_ids:
+            msg_detail = details.get(message_id)
+            if msg_detail is None:
+                continue
+            
+            headers = self._headers_to_dict(msg_detail.get("payload", {}).get("headers", []))
+            
+            email_data.append({
+                'id': message_id,
+                'from': headers.get('from', ''),
+                'to': headers.get('to', ''),
+                'subject': headers.get('subject', 'No Subject'),
+                'snippet': msg_detail.get('snippet', ''),
+                'threadId': msg_detail.get('threadId')
+            })
+        
+        return email_data
     
+    @staticmethod
+    def _headers_to_dict(payload_headers: List[Dict[str, str]]) -> Dict[str, str]:
+        return {h['name'].lower(): h['value'] for h in payload_headers}
+
     def send_email(self, to: str, subject: str, body: str, thread_id: str = None) -> str:
         message = self._create_message(to, subject, body, thread_id)
         try:
@@ -201,21 +696,29 @@ class GmailClient:
         """Ensure proper email formatting"""
         if not content.strip().startswith(("Dear", "Hello", "Hi")):
             content = f"Dear Recipient,\n\n{content}"
-        if not re.search(r"(Sincerely|Regards|Best),?$", content, re.IGNORECASE):
+        # the sign-off must end the text (a single trailing newline is allowed), case-insensitively
+        tail = content[-11:].removesuffix("\n").lower()
+        if not tail.endswith(SIGN_OFF_WORDS):
             content += "\n\nSincerely,\n[Your Name]"
         return content
 
     def _create_message(self, to: str, subject: str, message_text: str, thread_id: str = None) -> dict:
         email_text = f"To: {to}\nSubject: {subject}\n\n{message_text}"
-        message = {
-            'raw': base64.urlsafe_b64encode(email_text.encode()).decode(),
-            'threadId': thread_id
-        }
-        return {k: v for k, v in message.items() if v is not None}
+        message = {'raw': base64.urlsafe_b64encode(email_text.encode()).decode('ascii')}
+        if thread_id is not None:
+            message['threadId'] = thread_id
+        return message
     
+    def get_profile(self) -> dict:
+        now = time.monotonic()
+        if self._profile is None or now >= self._profile_expires:
+            self._profile = self.service.users().getProfile(userId='me').execute()
+            self._profile_expires = now + PROFILE_CACHE_TTL
+        return self._profile
+
     def test_gmail_connection(self):
         try:
-            profile = self.service.users().getProfile(userId='me').execute()
+            profile = self.get_profile()
             print("Gmail API connection successful!")
             print(f"Connected as: {profile['emailAddress']}")
             return True
@@ -224,27 +727,62 @@ class GmailClient:
             print(f"Error: {str(e)}")
             return False
             
+    def _thread_http(self):
+        return thread_local_http(self._local, self.creds)
+
     def get_email_content(self, message_id: str) -> Dict[str, str]:
+        with self._content_lock:
+            cached = self._content_cache.get(message_id)
+            if cached is not None:
+                self._content_cache.move_to_end(message_id)
+                return dict(cached)
+        
+        content = self._fetch_email_content(message_id)
+        if content:
+            with self._content_lock:
+                self._content_cache[message_id] = dict(content)
+                if len(self._content_cache) > EMAIL_CACHE_MAXSIZE:
+                    self._content_cache.popitem(last=False)
+        return content
+
+    @staticmethod
+    def _decode_body(data: str) -> str:
+        return base64.urlsafe_b64decode(data).decode('utf-8', 'replace')
+
+    @staticmethod
+    def _find_text_body(parts: List[dict]) -> str:
+        """First text/plain body in the MIME tree, searching nested multiparts after the top level."""
+        for part in parts:
+            part_body = part.get('body', {})
+            if (part.get('mimeType') == 'text/plain' and 'data' in part_body
+                    and part_body.get('size', 0) < MAX_TEXT_PART_SIZE):
+                return GmailClient._decode_body(part_body['data'])
+        for part in parts:
+            if part.get('parts'):
+                body = GmailClient._find_text_body(part['parts'])
+                if body:
+                    return body
+        return ""
+
+    def _fetch_email_content(self, message_id: str) -> Dict[str, str]:
         try:
             message = self.service.users().messages().get(
                 userId='me',
                 id=message_id,
-                format='full'
-            ).execute()
-            
-            headers = {}
-            for h in message['payload'].get('headers', []):
-                if h['name'].lower() in ['from', 'to', 'subject', 'date']:
-                    headers[h['name'].lower()] = h['value']
-            
-            body = ""
-            if 'parts' in message['payload']:
-                for part in message['payload']['parts']:
-                    if part['mimeType'] == 'text/plain' and 'data' in part['body']:
-                        body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                        break
-            elif 'body' in message['payload'] and 'data' in message['payload']['body']:
-                body = base64.urlsafe_b64decode(message['payload']['body']['data']).decode('utf-8')
+                format='full',
+                fields=GMAIL_CONTENT_FIELDS
+            ).execute(http=self._thread_http())
+            
+            headers = self._headers_to_dict(message['payload'].get('headers', []))
+            
+            payload = message['payload']
+            payload_body = payload.get('body', {})
+            if 'parts' in payload:
+                body = self._find_text_body(payload['parts'])
+            elif 'data' in payload_body:
+                body = self._decode_body(payload_body['data'])
+            else:
+                body = ""
             
             return {
                 'id': message['id'],
@@ -260,27 +798,13 @@ class GmailClient:
             print(f"Error reading email: {str(e)}")
             return {}
 class CalendarClient:
-    def __init__(self):
+    def __init__(self, db: Optional[DatabaseService] = None):
+        self._local = threading.local()
         self.service = self._authenticate()
-        self.db = DatabaseService()
+        self.db = db or DatabaseService()
     
     def _authenticate(self):
-        creds = None
-        if os.path.exists('token.json'):
-            creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-        
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    'credentials.json', SCOPES)
-                creds = flow.run_local_server(port=0)
-            
-            with open('token.json', 'w') as token:
-                token.write(creds.to_json())
-        
-        return build('calendar', 'v3', credentials=creds)
+        return build_service('calendar', 'v3')
     
     def test_connection(self): #Kind of debug code, testing the connection cuz it was disconnecting before 
         try:
@@ -300,19 +824,18 @@ class CalendarClient:
     
     def create_event(self, summary, start_time, end_time, attendees=None, location=None, description=None):
         try:
-            dubai_tz = pytz.timezone('Asia/Dubai')  # Dubai timezone
-            start_time = start_time.astimezone(dubai_tz)
-            end_time = end_time.astimezone(dubai_tz)
+            start_time = start_time.astimezone(DUBAI_TIMEZONE)
+            end_time = end_time.astimezone(DUBAI_TIMEZONE)
             
             event = {
                 'summary': summary,
                 'start': {
                     'dateTime': start_time.isoformat(),
-                    'timeZone': 'Asia/Dubai',
+                    'timeZone': DUBAI_TZ_NAME,
                 },
                 'end': {
                     'dateTime': end_time.isoformat(),
-                    'timeZone': 'Asia/Dubai',
+                    'timeZone': DUBAI_TZ_NAME,
                 },
             }
             
@@ -348,16 +871,16 @@ class CalendarClient:
             ).execute()
             
             if new_start_time:
-                new_start_time = new_start_time.astimezone(pytz.timezone('Asia/Dubai'))
+                new_start_time = new_start_time.astimezone(DUBAI_TIMEZONE)
                 event['start'] = {
                     'dateTime': new_start_time.isoformat(),
-                    'timeZone': 'Asia/Dubai',
+                    'timeZone': DUBAI_TZ_NAME,
                 }
             if new_end_time:
-                new_end_time = new_end_time.astimezone(pytz.timezone('Asia/Dubai'))
+                new_end_time = new_end_time.astimezone(DUBAI_TIMEZONE)
                 event['end'] = {
                     'dateTime': new_end_time.isoformat(),
-                    'timeZone': 'Asia/Dubai',
+                    'timeZone': DUBAI_TZ_NAME,
                 }
             
             if summary:
@@ -385,7 +908,7 @@ class CalendarClient:
            
     def list_events(self, max_results=25):
         try:
-            now = datetime.utcnow().isoformat() + 'Z'
+            now = datetime.now(timezone.utc).isoformat()
             events_result = self.service.events().list(
                 calendarId='primary',
                 timeMin=now,
@@ -421,7 +944,7 @@ class CalendarClient:
                 timeMax=end_rfc,
                 singleEvents=True,
                 orderBy='startTime'
-            ).execute()
+            ).execute(http=thread_local_http(self._local, get_credentials()))
             
             events = events_result.get('items', [])
             return len(events) == 0
@@ -429,6 +952,31 @@ class CalendarClient:
         except Exception as e:
             print(f"❌ Error checking availability: {str(e)}")
             return False
+
+    def get_busy_intervals(self, start_time: datetime, end_time: datetime) -> Optional[List[tuple]]:
+        """Busy (start, end) pairs on the primary calendar in one freebusy query, sorted and non-overlapping."""
+        try:
+            result = self.service.freebusy().query(body={
+                'timeMin': start_time.isoformat(),
+                'timeMax': end_time.isoformat(),
+                'items': [{'id': 'primary'}]
+            }).execute()
+            busy = sorted(
+                (datetime.fromisoformat(b['start']), datetime.fromisoformat(b['end']))
+                for b in result['calendars']['primary'].get('busy', [])
+            )
+            # merge overlapping or touching blocks so callers can bisect on the starts alone
+            merged = []
+            for block_start, block_end in busy:
+                if merged and block_start <= merged[-1][1]:
+                    if block_end > merged[-1][1]:
+                        merged[-1] = (merged[-1][0], block_end)
+                else:
+                    merged.append((block_start, block_end))
+            return merged
+        except Exception as e:
+            print(f"❌ Error fetching busy intervals: {str(e)}")
+            return None
     
     def get_calendar_timezone(self):
         try:
@@ -440,18 +988,33 @@ class CalendarClient:
 
 class EmailProcessor:
     def __init__(self):
-        self.gmail = GmailClient()
-        self.classifier = EmailClassifier()
-        self.calendar = CalendarClient()
         self.db = DatabaseService()
+        self.gmail = GmailClient(self.db)
+        self.classifier = EmailClassifier(self.db)
+        self.calendar = CalendarClient(self.db)
+        self._time_hint_batches = {}
+        self._claimed_time_texts = set()
+        self._time_hint_lock = threading.Lock()
+        self._time_hints_stop = threading.Event()
+        self._thread_events = None
+        self._touched_threads = set()
+        
+        self.user_email = self.gmail.user_email
+        user = self.db.get_user(self.user_email)
         
-        profile = self.gmail.service.users().getProfile(userId='me').execute()
-        self.user_email = profile['emailAddress']
-        self.current_user = self.db.get_user(self.user_email)
-        
-        if not self.current_user:
+        if user:
+            self.current_user_id = user['id']
+        else:
             token_data = {}  
-            self.current_user = self.db.create_user(self.user_email, token_data)
+            created = self.db.create_user(self.user_email, token_data)
+            if created:
+                self.current_user_id = created['id']
+            else:
+                # create_user returns None on IntegrityError, e.g. the row appeared meanwhile
+                user = self.db.get_user(self.user_email)
+                if not user:
+                    raise RuntimeError(f"Could not create or load user record for {self.user_email}")
+                self.current_user_id = user['id']
 
     def _enter_composition_flow(self, draft: str, recipient: str, subject: str, 
                             thread_id: str = None, context: str = ""):
@@ -461,7 +1024,7 @@ class EmailProcessor:
         while True:
             print("\n✉️ Email Composition Menu:")
             print("[1] Send email now")
-            print("[2] Edit line-by-line")
+            print("[2] Edit in your editor (line-by-line if unavailable)")
             print("[3] Revise with AI instructions")
             print("[4] Regenerate from scratch")
             print("[5] View original message")
@@ -472,10 +1035,7 @@ class EmailProcessor:
             if choice == "1": 
                 print(f"\nTo: {recipient}")
                 print(f"Subject: {subject}")
-                print("\nMessage Content:")
-                print("=" * 50)
-                print(current_content)
-                print("=" * 50)
+                print_block("\nMessage Content:", current_content)
                 
                 confirm = input("Send this email? (y/n): ").lower()
                 if confirm == 'y':
@@ -488,7 +1048,7 @@ class EmailProcessor:
                     if "Message Id" in result:
                         message_id = result.split(": ")[1] if ": " in result else "unknown"
                         self.db.log_sent_email({
-                        'user_id': self.current_user.id,
+                        'user_id': self.current_user_id,
                         'thread_id': thread_id,
                         'message_id': message_id,
                         'recipient': recipient,
@@ -502,37 +1062,25 @@ class EmailProcessor:
             
             elif choice == "2": 
                 current_content = self._edit_email_interactive(current_content)
-                print("\nEdited Email:")
-                print("=" * 50)
-                print(current_content)
-                print("=" * 50)
+                print_block("\nEdited Email:", current_content)
                 
             elif choice == "3": 
                 print("\nCurrent AI Context:")
                 print(f"Original message: {context[:200]}...")
                 instruction = input("Enter revision instructions: ")
                 current_content = self._edit_email_with_ai(current_content, instruction)
-                print("\nRevised Email:")
-                print("=" * 50)
-                print(current_content)
-                print("=" * 50)
+                print_block("\nRevised Email:", current_content)
                 
             elif choice == "4":  
                 new_prompt = input("Enter new instructions (or press Enter to keep context): ")
                 if not new_prompt:
                     new_prompt = f"Improve this email draft: {current_content[:500]}"
-                current_content = self.classifier._call_ai_api(new_prompt)
+                current_content = self.classifier._call_ai_api(new_prompt, use_cache=False)
                 current_content = self._clean_generated_email(current_content)
-                print("\nRegenerated Email:")
-                print("=" * 50)
-                print(current_content)
-                print("=" * 50)
+                print_block("\nRegenerated Email:", current_content)
                 
             elif choice == "5":  
-                print("\nOriginal Message:")
-                print("=" * 50)
-                print(context)
-                print("=" * 50)
+                print_block("\nOriginal Message:", context)
                 
             elif choice == "6":  
                 print("Email composition cancelled.")
@@ -553,32 +1101,19 @@ class EmailProcessor:
         
         sender_email = ""
         if sender:
-            email_match = re.search(r'<([^>]+)>', sender)
+            email_match = ANGLE_EMAIL_RE.search(sender)
             sender_email = email_match.group(1) if email_match else sender
         
-        prompt = f"""
-        Compose a professional email response to this message:
-        
-        From: {sender}
-        Subject: {subject}
-        
-        Original Message:
-        {body[:1000]}
-        
-        Response should:
-        - Be polite and professional
-        - Address all points in the original email
-        - Keep it concise (3-5 sentences max)
-        - Include a proper greeting and closing
-        """
+        prompt = (
+            f"From: {sender}\n"
+            f"Subject: {subject}\n\n"
+            f"Original Message:\n{body[:1000]}"
+        )
         
-        draft = self.classifier._call_ai_api(prompt)
+        draft = self.classifier._call_ai_api(prompt, system=REPLY_SYSTEM_PROMPT)
         draft = self._clean_generated_email(draft)
         
-        print("\nAI-Generated Draft:")
-        print("=" * 50)
-        print(draft)
-        print("=" * 50)
+        print_block("\nAI-Generated Draft:", draft)
         
         self._enter_composition_flow(
             draft=draft,
@@ -588,35 +1123,67 @@ class EmailProcessor:
             context=body
         )
     def process_inbox(self, lookback_hours: int = 24):
+        pending_logs = []
+        pool = ThreadPoolExecutor(max_workers=GMAIL_FETCH_WORKERS)
         try:
             print("\n=== Processing Inbox ===")
-            cutoff = datetime.now(pytz.utc) - timedelta(hours=lookback_hours)
-            print(f"Looking for emails since {cutoff}")
-            
-            emails = self.gmail.get_recent_emails(max_results=50, after_date=cutoff.isoformat())
+            history_id = self.gmail.load_history_id()
+            synced = self.gmail.get_emails_since(history_id) if history_id else None
+            if synced:
+                emails, sync_to = synced
+                print("Looking for emails added since last sync")
+            else:
+                # remember where the mailbox is now so the next run only lists what arrived after
+                sync_to = self.gmail.get_profile().get('historyId')
+                cutoff = datetime.now(timezone.utc) - timedelta(hours=lookback_hours)
+                print(f"Looking for emails since {cutoff}")
+                emails = self.gmail.get_recent_emails(max_results=50, after_date=cutoff.isoformat())
             
             if not emails:
+                if sync_to:
+                    self.gmail.save_history_id(sync_to)
                 print("No recent emails found to process.")
                 input("Press Enter to return to main menu...")
                 return
                 
             print(f"Found {len(emails)} emails to process...\n")
-            
+            unprocessed_ids = set(self.db.filter_unprocessed([e['id'] for e in emails]))
+            # one query for the existing event of every thread instead of one per reschedule email
+            self._thread_events = self.db.get_calendar_events_by_threads(
+                list({e['threadId'] for e in emails if e['id'] in unprocessed_ids and e.get('threadId')})
+            )
+            self._touched_threads = set()
+            # bodies download in the background while the user reads; only the current one is waited on
+            fetches = {
+                e['id']: pool.submit(self.gmail.get_email_content, e['id'])
+                for e in emails if e['id'] in unprocessed_ids
+            }
+            # meeting times for the whole inbox come from a few batched AI calls instead of one per email
+            self._time_hint_batches = {}
+            self._claimed_time_texts = set()
+            self._time_hints_stop = threading.Event()
+            pool.submit(self._prefetch_meeting_times, list(fetches.values()), self._time_hints_stop)
+            
+            # emails handled in this run, so [P] shows them again without refetching or re-running detection
+            reviewed = {}
             current_index = 0
             while current_index < len(emails):
                 email = emails[current_index]
+                full_email = reviewed.get(email['id'])
                 
-                if self.db.email_already_processed(email['id']):
-                    print(f"Email already processed: {email['subject']}")
-                    current_index += 1
-                    continue
+                if full_email is None:
+                    if email['id'] not in unprocessed_ids:
+                        print(f"Email already processed: {email['subject']}")
+                        current_index += 1
+                        continue
+                        
+                    fetch = fetches.pop(email['id'], None)
+                    full_email = (fetch.result() if fetch else None) or self.gmail.get_email_content(email['id'])
                     
-                full_email = self.gmail.get_email_content(email['id'])
-                
-                if not full_email or not full_email.get('body'):
-                    print(f"Skipping email - couldn't retrieve content: {email['subject']}")
-                    current_index += 1
-                    continue
+                    if not full_email or not full_email.get('body'):
+                        print(f"Skipping email - couldn't retrieve content: {email['subject']}")
+                        current_index += 1
+                        continue
                 
                 print("="*80)
                 print(f"EMAIL {current_index+1}/{len(emails)}")
@@ -625,27 +1192,34 @@ class EmailProcessor:
                 print(f"Snippet: {email['snippet'][:200]}{'...' if len(email['snippet']) > 200 else ''}")
                 print("="*80)
                 
-                classification = self.classifier.classify_email(full_email.get('body', ''))
-                actions = {"processed": True}
-                meeting_actions = {}
-                
-                if self._is_meeting_request(full_email.get('body', '')):
-                    print("🔔 Meeting request detected!")
-                    meeting_actions = self._handle_meeting_email(full_email)
-                    actions.update(meeting_actions)
-                else:
-                    print("ℹ️ No meeting request detected")
-                
-                self.db.log_processed_email({
-                    'id': full_email['id'],
-                    'user_id': self.current_user.id,
-                    'thread_id': full_email.get('threadId'),
-                    'subject': full_email.get('subject', 'No Subject'),
-                    'from': full_email.get('from'),
-                    'category': classification['category'],
-                    'actions': actions,
-                    'ai_response': meeting_actions.get('ai_response', '') 
-                })
+                if email['id'] not in reviewed:
+                    classification = self.classifier.classify_email(full_email.get('body', ''))
+                    actions = {"processed": True}
+                    meeting_actions = {}
+                    
+                    if self._is_meeting_request(email['subject'], full_email.get('body', '')):
+                        print("🔔 Meeting request detected!")
+                        # reschedule lookups read earlier emails of the thread from the db
+                        self._flush_processed_logs(pending_logs)
+                        meeting_actions = self._handle_meeting_email(full_email)
+                        # whatever it scheduled makes the prefetched event for this thread stale
+                        self._touched_threads.add(full_email.get('threadId'))
+                        actions.update(meeting_actions)
+                    else:
+                        print("ℹ️ No meeting request detected")
+                    
+                    reviewed[email['id']] = full_email
+                    unprocessed_ids.discard(full_email['id'])
+                    pending_logs.append({
+                        'id': full_email['id'],
+                        'user_id': self.current_user_id,
+                        'thread_id': full_email.get('threadId'),
+                        'subject': full_email.get('subject', 'No Subject'),
+                        'from': full_email.get('from'),
+                        'category': classification['category'],
+                        'actions': actions,
+                        'ai_response': meeting_actions.get('ai_response', '') 
+                    })
                 
                 while True:
                     print("\nActions for this email:")
@@ -669,13 +1243,31 @@ class EmailProcessor:
                         print("Invalid choice. Please choose C, N, P, or Q.")
             
             print(f"\nProcessed {current_index} emails.")
+            # only advance the sync point once every listed email has been reviewed
+            if sync_to:
+                self.gmail.save_history_id(sync_to)
             
         except Exception as e:
             print(f"Error processing inbox: {str(e)}")
             import traceback
             traceback.print_exc() 
         finally:
+            # batches not sent yet are skipped; one already in flight can't be recalled
+            self._time_hints_stop.set()
+            self._thread_events = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._flush_processed_logs(pending_logs)
             input("Press Enter to return to main menu...")
+
+    def _flush_processed_logs(self, pending_logs: list):
+        if not pending_logs:
+            return
+        try:
+            self.db.log_processed_emails_bulk(pending_logs)
+        except Exception as e:
+            print(f"⚠️ Failed to log processed emails: {str(e)}")
+        pending_logs.clear()
+
     def _select_existing_event(self, days_ahead=7):
         """Let user select an existing event to reschedule"""
         now = datetime.now(DUBAI_TIMEZONE)
@@ -688,20 +1280,22 @@ class EmailProcessor:
             print("No upcoming events found")
             return None
             
+        # calendar times are RFC 3339 (or a bare date for all-day events), so fromisoformat covers them
         filtered_events = []
         for event in events:
             start_str = event['start'].get('dateTime', event['start'].get('date'))
-            start = parser.parse(start_str)
+            start = _parse_iso(start_str)
+            if start is None:
+                from dateutil import parser
+                start = parser.parse(start_str)
             if now <= start <= end_date:
-                filtered_events.append(event)
+                filtered_events.append((event, start))
                 
         if not filtered_events:
             print("No events found in the time range")
             return None
             
-        for i, event in enumerate(filtered_events):
-            start_str = event['start'].get('dateTime', event['start'].get('date'))
-            start = parser.parse(start_str)
+        for i, (event, start) in enumerate(filtered_events):
             print(f"[{i}] {event['summary']} - {start.strftime('%a %b %d, %I:%M %p')}")
             
         choice = input("Select event number (or 'c' to cancel): ").strip()
@@ -711,7 +1305,7 @@ class EmailProcessor:
         try:
             index = int(choice)
             if 0 <= index < len(filtered_events):
-                return filtered_events[index]['id']  
+                return filtered_events[index][0]['id']  
         except ValueError:
             pass
             
@@ -725,43 +1319,37 @@ class EmailProcessor:
         2. Removing email signatures
         3. Isolating the user's new text
         """
-        quote_patterns = [
-            r"On .* wrote:",  # English
-            r"Le .* \u00E9crit :",  # French
-            r"El .* escribi\u00F3:",  # Spanish
-            r"\d{4}-\d{2}-\d{2} \d{2}:\d{2} .* <.*>:",  # Email headers
-            r"From: .*",  # Email headers
-            r"-----Original Message-----",
-            r"_{10,}",  # Lines of underscores
-            r"\-{10,}",  # Lines of dashes
-            r"Sent from my .*",  # Signatures
-        ]
-        
-        lines = email_body.splitlines()
+        # one scan over the whole body finds the first quote marker; keep only the lines above it
+        quote = QUOTE_RE.search(email_body)
+        if quote:
+            email_head = email_body[:email_body.rfind('\n', 0, quote.start()) + 1]
+        else:
+            email_head = email_body
         clean_lines = []
         
-        for line in lines:
-            if any(re.search(pattern, line, re.IGNORECASE) for pattern in quote_patterns):
-                break  
-                
+        for line in email_head.splitlines():
             if line.strip() and not line.startswith(('>', '|')):
                 clean_lines.append(line)
         
         clean_body = "\n".join(clean_lines)
         
         if len(clean_body) < 50:
-            match = re.search(r"^(.*?)(?:" + "|".join(quote_patterns) + ")", 
-                            email_body, re.DOTALL | re.IGNORECASE)
+            match = QUOTE_SPLIT_RE.search(email_body)
             if match:
                 clean_body = match.group(1).strip()
         
         return clean_body.strip()
     
+    def _calendar_event_for_thread(self, thread_id: str):
+        # the inbox-wide prefetch holds until this run handles a meeting email in the thread
+        if self._thread_events is not None and thread_id not in self._touched_threads:
+            return self._thread_events.get(thread_id)
+        return self.db.get_calendar_event_by_thread(thread_id)
+
     def _handle_meeting_email(self, email: Dict[str, str]):
         raw_body = email.get('body', '')
         
         clean_body = self._extract_latest_message(raw_body)
-        clean_body_lower = clean_body.lower()
         
 
         sender = email.get('from')
@@ -769,28 +1357,17 @@ class EmailProcessor:
         actions = {"meeting_processed": True}
         
         # Extract clean sender email
-        email_match = re.search(r'<([^>]+)>', sender)
+        email_match = ANGLE_EMAIL_RE.search(sender)
         sender_email = email_match.group(1) if email_match else sender
         
-        reschedule_keywords = [
-            'reschedule', 're-schedule', 'rearrange', 'change time', 
-            'move', 'postpone', 'new time', 'different time', 'adjust',
-            'push back', 'push forward', 'shift', 'relocate', 'change our meeting',
-            'alternate time', 'rescheduling', 'replan', 're-book'
-        ]
-        
-        is_reschedule = any(keyword in clean_body_lower for keyword in reschedule_keywords)
-        
-        if not is_reschedule:
-            subject_lower = subject.lower()
-            is_reschedule = any(keyword in subject_lower for keyword in reschedule_keywords)
+        is_reschedule = bool(RESCHEDULE_RE.search(clean_body) or RESCHEDULE_RE.search(subject))
         
         thread_id = email.get('threadId')
         
         existing_event = None
         if is_reschedule and thread_id:
             print("🔁 Reschedule request detected")
-            existing_event = self.db.get_calendar_event_by_thread(thread_id)
+            existing_event = self._calendar_event_for_thread(thread_id)
             
             if existing_event:
                 print(f"  Found existing event: {existing_event.title} on {existing_event.start_time}")
@@ -816,7 +1393,7 @@ class EmailProcessor:
         
         proposed_time = None
         for method in detection_methods:
-            proposed_time = method(clean_body) 
+            proposed_time = method(clean_body, clean_text=clean_body) 
             if proposed_time:
                 break
                 
@@ -827,7 +1404,7 @@ class EmailProcessor:
             return actions
             
         dubai_time = proposed_time.astimezone(DUBAI_TIMEZONE)
-        time_str = dubai_time.strftime('%A, %B %d at %I:%M %p')
+        time_str = dubai_time.strftime(MEETING_TIME_FORMAT)
         print(f"⏱️ Proposed time: {time_str} (Dubai time)")
         
         confirm = input("Is this correct? (y/n): ").lower()
@@ -835,8 +1412,8 @@ class EmailProcessor:
             try:
                 new_time = input("Enter correct time (YYYY-MM-DD HH:MM): ")
                 manual_time = datetime.strptime(new_time, "%Y-%m-%d %H:%M")
-                proposed_time = DUBAI_TIMEZONE.localize(manual_time)
-                print(f"Using manual time: {proposed_time.strftime('%A, %B %d at %I:%M %p')}")
+                proposed_time = manual_time.replace(tzinfo=DUBAI_TIMEZONE)
+                print(f"Using manual time: {proposed_time.strftime(MEETING_TIME_FORMAT)}")
             except ValueError:
                 print(" Invalid format. Using detected time.")
         
@@ -857,41 +1434,38 @@ class EmailProcessor:
             if input("Suggest alternative? (y/n): ").lower() == 'y':
                 self._suggest_alternative_times(email, sender_email, proposed_time)
         return actions
-    def _detect_with_nlp(self, text: str) -> Optional[datetime]:
+    def _detect_with_nlp(self, text: str, clean_text: Optional[str] = None) -> Optional[datetime]:
         try:
             # Get current time in Dubai
 
             now = datetime.now(DUBAI_TIMEZONE)
-            print(f"Current Dubai time: {now.strftime('%Y-%m-%d %H:%M')}")
-            clean_text = self._extract_latest_message(text)
-            print(f"🧹 Cleaned text for NLP analysis:\n{clean_text}\n{'='*50}")
-            patterns = [
-                r'tomorrow at (\d{1,2}(?::\d{2})?\s*(?:am|pm)?)',  # "tomorrow at 10pm"
-                r'at (\d{1,2}(?::\d{2})?\s*(?:am|pm)?)\s*tomorrow',  # "at 10pm tomorrow"
-                r'next (\w+day)\s*at (\d{1,2}(?::\d{2})?\s*(?:am|pm)?)'  # "next friday at 8pm"
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
+            logger.debug("Current Dubai time: %s", now)
+            clean_text = clean_text or self._extract_latest_message(text)
+            logger.debug("Cleaned text for NLP analysis:\n%s", clean_text)
+            for pattern in NLP_TIME_PATTERNS:
+                match = pattern.search(text)
                 if match:
                     time_str = ' '.join(match.groups())
-                    print(f"Pattern matched: '{pattern}' → Extracted: '{time_str}'")
+                    logger.debug("Pattern matched: %r -> extracted %r", pattern.pattern, time_str)
                     
-                    parsed = dateparser.parse(
-                        time_str,
-                        settings={
-                            'TIMEZONE': 'Asia/Dubai',
-                            'RELATIVE_BASE': now,
-                            'PREFER_DATES_FROM': 'future',
-                        },
-                        languages=['en'] 
-                    )
+                    parsed = _fast_parse_time(time_str, now)
+                    if not parsed:
+                        import dateparser
+                        parsed = dateparser.parse(
+                            time_str,
+                            settings={
+                                'TIMEZONE': DUBAI_TZ_NAME,
+                                'RELATIVE_BASE': now,
+                                'PREFER_DATES_FROM': 'future',
+                            },
+                            languages=['en'] 
+                        )
 
                     if parsed:
                         if not parsed.tzinfo:
-                            parsed = DUBAI_TIMEZONE.localize(parsed)
+                            parsed = parsed.replace(tzinfo=DUBAI_TIMEZONE)
                         
-                        print(f"Parsed time: {parsed.strftime('%Y-%m-%d %H:%M')}")
+                        logger.debug("Parsed time: %s", parsed)
                         
                         if parsed < now:
                             print("⚠️ Parsed time is in the past! Ignoring.")
@@ -902,31 +1476,34 @@ class EmailProcessor:
         except Exception as e:
             print(f"⚠️ NLP detection error: {str(e)}")
             return None
-    def _detect_with_ai(self, text: str) -> Optional[datetime]:
+    def _detect_with_ai(self, text: str, clean_text: Optional[str] = None) -> Optional[datetime]:
         try:
-            clean_text = self._extract_latest_message(text)
+            clean_text = clean_text or self._extract_latest_message(text)
             now = datetime.now(DUBAI_TIMEZONE)
-            print(f"AI detection using current time: {now}")
+            logger.debug("AI detection using current time: %s", now)
 
-            prompt = f'''Extract meeting time ONLY from the MOST RECENT message in this email. 
-            Ignore any quoted/forwarded content or previous messages. Respond ONLY with:
-            - ISO 8601 format (YYYY-MM-DDTHH:MM:SS) in Asia/Dubai timezone
-            - "none" if no time found in the new message
-            
-            Current Date: {datetime.now(DUBAI_TIMEZONE).date()}
-            Email: {clean_text[:2000]}'''
+            prompt = (
+                f"Current Date: {now.date()}\n"
+                f"Email: {clean_text[:2000]}"
+            )
             
-            response = self.classifier._call_ai_api(prompt).strip()
-            print(f"AI response: {response}")
+            response = self._batched_time_hint(text)
+            if response is None:
+                response = self.classifier._call_ai_api(prompt, system=LATEST_TIME_SYSTEM_PROMPT)
+            response = response.strip()
+            logger.debug("AI response: %s", response)
             
             if response.lower() != 'none':
                 if 'T' not in response:
-                    response = re.sub(r'(\d{4}-\d{2}-\d{2}) (\d{2}:\d{2}:\d{2})', r'\1T\2', response)
+                    response = ISO_SPACE_RE.sub(r'\1T\2', response)
                 
-                dt = parser.parse(response)
+                dt = _parse_iso(response)
+                if dt is None:
+                    from dateutil import parser
+                    dt = parser.parse(response)
                 
                 if dt.tzinfo is None:
-                    dt = DUBAI_TIMEZONE.localize(dt)
+                    dt = dt.replace(tzinfo=DUBAI_TIMEZONE)
                     
                 if dt < now:
                     print("⚠️ AI returned past date!")
@@ -935,78 +1512,103 @@ class EmailProcessor:
                 return dt
         except Exception as e:
             print(f"⚠️ AI detection failed: {str(e)}")
-            return self._detect_manual_fallback(text)
+            return self._detect_manual_fallback(text, clean_text=clean_text)
         return None
 
-    def _detect_manual_fallback(self, text: str) -> Optional[datetime]:
+    def _prefetch_meeting_times(self, fetches: list, stop: threading.Event):
+        # each batch is sent as soon as it fills, so early emails don't wait for the whole inbox
+        chunk = []
+        for fetch in fetches:
+            if stop.is_set():
+                return
+            email = fetch.result()
+            body = email.get('body') if email else None
+            if body and self._is_meeting_request(email.get('subject', ''), body):
+                clean_body = self._extract_latest_message(body)
+                # times the deterministic patterns can read never need the model
+                if not any(pattern.search(clean_body) for pattern in NLP_TIME_PATTERNS):
+                    chunk.append(clean_body)
+            if len(chunk) == AI_DETECT_BATCH_SIZE:
+                self._run_time_batch(chunk, stop)
+                chunk = []
+        if chunk:
+            self._run_time_batch(chunk, stop)
+
+    def _run_time_batch(self, texts: List[str], stop: threading.Event):
+        batch = Future()
+        with self._time_hint_lock:
+            # emails the loop already detected on its own would only be paid for twice
+            texts = [t for t in texts if t not in self._claimed_time_texts]
+            if not texts or stop.is_set():
+                return
+            for text in texts:
+                self._time_hint_batches.setdefault(text, batch)
+        try:
+            batch.set_result(dict(zip(texts, self._detect_meeting_times_batch(texts))))
+        except Exception as e:
+            batch.set_exception(e)
+
+    def _detect_meeting_times_batch(self, texts: List[str]) -> List[Optional[str]]:
+        """Raw AI answers (ISO string or "none") for several emails in one call; None where unusable."""
+        results = [None] * len(texts)
+        # texts arrive already stripped of quoted history by _prefetch_meeting_times
+        items = [{"index": i, "email": t[:2000]} for i, t in enumerate(texts)]
+        prompt = (
+            f"Current Date: {datetime.now(DUBAI_TIMEZONE).date()}\n"
+            f"Emails: {orjson.dumps(items).decode()}"
+        )
+        response = self.classifier._call_ai_api(prompt, system=BATCH_TIME_SYSTEM_PROMPT)
+        try:
+            answers = orjson.loads(response.strip().strip('`').removeprefix('json'))
+        except orjson.JSONDecodeError:
+            return results
+        for answer in answers if isinstance(answers, list) else []:
+            index = answer.get('index') if isinstance(answer, dict) else None
+            if isinstance(index, int) and 0 <= index < len(texts) and isinstance(answer.get('time'), str):
+                results[index] = answer['time']
+        return results
+
+    def _batched_time_hint(self, text: str) -> Optional[str]:
+        with self._time_hint_lock:
+            batch = self._time_hint_batches.get(text)
+            if batch is None:
+                # not sent yet: the caller asks for this email alone and later batches leave it out
+                self._claimed_time_texts.add(text)
+                return None
+        try:
+            # the batch holding this text is already in flight, so waiting beats paying for it again
+            return batch.result().get(text)
+        except Exception as e:
+            print(f"⚠️ Batched time detection failed: {str(e)}")
+            return None
+
+    def _detect_manual_fallback(self, text: str, clean_text: Optional[str] = None) -> Optional[datetime]:
         try:
-            time_match = re.search(r'(\d{1,2}:\d{2}\s*(?:am|pm)?', text, re.IGNORECASE)
-            day_match = re.search(r'(mon|tue|wed|thu|fri|sat|sun)', text, re.IGNORECASE)
-            clean_text = self._extract_latest_message(text)
-            print(f"🧹 Cleaned text for NLP analysis:\n{clean_text}\n{'='*50}")
+            time_match = MANUAL_TIME_RE.search(text)
+            day_match = MANUAL_DAY_RE.search(text)
+            clean_text = clean_text or self._extract_latest_message(text)
+            logger.debug("Cleaned text for NLP analysis:\n%s", clean_text)
             if time_match and day_match:
                 time_str = time_match.group(1)
                 day_str = day_match.group(1)
                 combined = f"next {day_str} at {time_str}"
-                parsed = dateparser.parse(combined, settings={'TIMEZONE': 'Asia/Dubai'})
+                parsed = _fast_parse_time(combined, datetime.now(DUBAI_TIMEZONE))
                 if parsed:
-                    return DUBAI_TIMEZONE.localize(parsed)
+                    return parsed
+                import dateparser
+                parsed = dateparser.parse(combined, settings={'TIMEZONE': DUBAI_TZ_NAME})
+                if parsed:
+                    return parsed.replace(tzinfo=DUBAI_TIMEZONE)
         except Exception:
             pass
         return None
 
-    def _is_meeting_request(self, body: str) -> bool:
-        clean_body = self._extract_latest_message(body)
-        clean_body_lower = clean_body.lower()
-        meeting_phrases = [
-            # Core meeting terms
-            "meet", "meeting", "gathering", "appointment", "session", "conference", "consultation",
-            
-            # Scheduling terms
-            "schedule", "book a", "set up", "arrange", "plan a", "organize", "coordinate",
-            
-            # Time-specific terms
-            "catch up", "touch base", "sync up", "check in", "follow up", "get together", "reconnect",
-            
-            # Activity-based terms
-            "grab coffee", "lunch meeting", "dinner meeting", "video call", "zoom call", "teams meeting", 
-            "google meet", "call", "chat", "discuss", "talk", "brainstorm", "review", "briefing", 
-            "workshop", "presentation", "demo", "walkthrough", 
-            
-            # Confirmation terms
-            "confirm our", "still on", "are we still", "following up", "checking in", "reminder about",
-            "as agreed", "as discussed", "as planned",
-            
-            # Location-based terms
-            "in person", "face to face", "at the office", "remotely", "virtually",
-            
-            # Invitation terms
-            "invite you", "join us", "would you be available", "are you free", "are you available",
-            "let's connect", "can we", "could we", "would you like to", "suggest we",
-            
-            # Formal terms
-            "interview", "negotiation", "mediation", "assessment", "evaluation", "training", "onboarding"
-        ]
-        
-        # Common false positives to exclude
-        exclude_phrases = [
-            "meeting room", "meeting rooms", "meeting point", "meeting place", "meeting link",
-            "meeting id", "meeting password", "meeting agenda", "meeting minutes", "meeting notes",
-            "meeting recording", "meeting schedule", "meeting request", "meeting invitation"
-        ]
-        
-        body_lower = body.lower()
-        
-        if any(phrase in body_lower for phrase in exclude_phrases):
-            return False
-            
-        return any(phrase in body_lower for phrase in meeting_phrases)
+    def _is_meeting_request(self, *texts: str) -> bool:
+        # each text (subject, body) is judged on its own so an excluded phrase in one doesn't veto the other
+        return any(_mentions_meeting(text) for text in texts)
 
 
 
-    def _is_time_available(self, start_time: datetime, duration_minutes: int = 60) -> bool:
-        end_time = start_time + timedelta(minutes=duration_minutes)
-        return self.calendar.check_availability(start_time, end_time)
     def extract_event_id(event_link):
         parsed = urlparse(event_link)
         query = parse_qs(parsed.query)
@@ -1015,7 +1617,7 @@ class EmailProcessor:
     def _schedule_and_confirm(self, subject, body, sender, start_time, email_id, existing_event=None):
         dubai_time = start_time.astimezone(DUBAI_TIMEZONE)
         end_time = start_time + timedelta(hours=1)
-        time_str = dubai_time.strftime('%A, %B %d at %I:%M %p')
+        time_str = dubai_time.strftime(MEETING_TIME_FORMAT)
         
         meeting_summary = self.classifier.summarize_meeting(body)
         event_created = False
@@ -1069,7 +1671,7 @@ class EmailProcessor:
             if event_result:
                 print(f"✅ New meeting scheduled: {event_result.get('link', '')}")
                 self.db.log_calendar_event({
-                    'user_id': self.current_user.id,
+                    'user_id': self.current_user_id,
                     'email_id': email_id,
                     'title': f"Meeting: {subject}",
                     'start_time': start_time,
@@ -1094,7 +1696,7 @@ class EmailProcessor:
             
             if result.get('status') == 'success':
                 self.db.log_sent_email({
-                    'user_id': self.current_user.id,
+                    'user_id': self.current_user_id,
                     'thread_id': email_id,
                     'message_id': result.get('message_id'),
                     'recipient': sender,
@@ -1107,165 +1709,30 @@ class EmailProcessor:
         
         print("❌ Failed to schedule/confirm meeting")
         return False
-    def _suggest_alternative_times(self, email, sender, original_time):
-        print("  🔍 Finding available times near proposed time...")
-        alternatives = self._find_available_times(original_time)
-        
-        if not alternatives:
-            print("  ⚠️ No good alternatives found nearby")
-            return self._propose_new_time(email, sender)
-        
-        response_body = self._generate_alternative_time_response(
-            email.get('body', ''),
-            original_time,
-            alternatives
-        )
-        
-        print("\n📝 Suggested Response:")
-        print("=" * 50)
-        print(response_body)
-        print("=" * 50)
-        
-        send = input("Send this response? (y/n): ").lower()
-        if send == 'y':
-            subject = f"Re: {email.get('subject', 'Meeting Request')}"
-            result = self.gmail.send_email(
-                to=sender,
-                subject=subject,
-                body=response_body
-            )
-            if "Message Id" in result:
-                print("  ✅ Response sent successfully!")
-                return True
-        return False
-
-    def _find_available_times(self, original_time, max_results=3, search_range=7):
-        alternatives = []
-        time_slots = [
-            original_time + timedelta(hours=1),
-            original_time - timedelta(hours=1),
-            original_time + timedelta(days=1),
-            original_time - timedelta(days=1),
-            original_time + timedelta(weeks=1)
-        ]
-        
-        for i in range(1, search_range + 1):
-            time_slots.append(original_time + timedelta(days=i))
-        
-        for slot in time_slots:
-            if self._is_time_available(slot):
-                alternatives.append(slot)
-                if len(alternatives) >= max_results:
-                    break
-        
-        return alternatives
-
-    def _generate_alternative_time_response(self, body, original_time, alternatives):
-        original_str = original_time.strftime('%A, %B %d at %I:%M %p')
-        alt_str = "\n".join([f"- {t.strftime('%A, %B %d at %I:%M %p')}" for t in alternatives])
-        
-        prompt = (
-            "Compose a polite email response suggesting alternative meeting times. "
-            "Keep it professional but friendly. Reference the original meeting request "
-            "and explain that the proposed time is unavailable. Suggest the alternative "
-            "times clearly and ask which works best.\n\n"
-            f"Original proposed time: {original_str}\n"
-            f"Available times:\n{alt_str}\n\n"
-            f"Original message context: {body[:300]}"
-        )
-        
-        return self.classifier._call_ai_api(prompt)
-
-    def _propose_new_time(self, email, sender):
-        """Propose a new meeting time when none is specified"""
-        print("  ⌚ Finding next available time slot...")
-        now = datetime.now(pytz.utc)
-        next_available = None
-        
-        for day in range(0, 7):
-            for hour in [9, 11, 14, 16]: 
-                candidate = now + timedelta(days=day, hours=hour)
-                if self._is_time_available(candidate):
-                    next_available = candidate
-                    break
-            if next_available:
-                break
-        
-        if not next_available:
-            print("  ⚠️ No available times found in next 7 days")
-            return False
-        
-        print(f"  ⏱️ Next available time: {next_available.strftime('%A, %B %d at %I:%M %p')}")
-        choice = input("  Propose this time? (y/n): ").lower()
-        
-        if choice == 'y':
-            proposal_body = (
-                f"Hi there,\n\n"
-                f"Thanks for your meeting request! How about "
-                f"{next_available.strftime('%A, %B %d at %I:%M %p')}?\n\n"
-                f"Please let me know if this works for you.\n\n"
-                f"Best regards,\n[Your Name]"
-            )
-            
-            result = self.gmail.send_email(
-                to=sender,
-                subject=f"Re: {email.get('subject', 'Meeting')}",
-                body=proposal_body
-            )
-            
-            if "Message Id" in result:
-                print("  ✅ Time proposal sent successfully!")
-                return True
-        return False
 
     def _clean_generated_email(self, content: str) -> str:
-        prefixes = [
-            "Here's a polished and professional email you could use",
-            "Below is a professional email template",
-            "Here is a professional email draft",
-            "Certainly! Below is a polite and professional email template",
-            "Here’s a polished and professional email",
-            "Here's a professional email draft",
-            "Here's a polished and professional email you could use"
-        ]
+        prefix_match = GENERATED_EMAIL_PREFIX_RE.match(content)
+        if prefix_match:
+            content = content[prefix_match.end():].lstrip(": \n-")
         
-        for prefix in prefixes:
-            if content.startswith(prefix):
-                content = content[len(prefix):].lstrip(": \n-")
-        
-        content = re.sub(r"\*{2}Subject:\*{2}\s*", "Subject: ", content)
-        content = re.sub(r"\*{2}(.*?)\*{2}", r"\1", content)
-        content = re.sub(r"#{2,}\s*(.*?)\s*", "", content)
-        content = re.sub(r"---.*", "", content, flags=re.DOTALL)
-        content = re.sub(r"###.*", "", content, flags=re.DOTALL)
-        
-        footer_phrases = [
-            "Optional Additions:",
-            "Customization Tips:",
-            "Notes:",
-            "Adjust based on",
-            "Let me know if you'd like any adjustments",
-            "Feel free to customize",
-            "You can adjust"
-        ]
-        for phrase in footer_phrases:
-            if phrase in content:
-                content = content.split(phrase)[0]
+        cut = content.find("---")
+        if cut != -1:
+            content = content[:cut]
+        content = MARKDOWN_RE.sub(_markdown_repl, content)
+        
+        content = GENERATED_EMAIL_FOOTER_RE.split(content, maxsplit=1)[0]
                 
-        content = re.sub(r'\n{3,}', '\n\n', content)
+        content = BLANK_LINES_RE.sub('\n\n', content)
         
         return content.strip()
     
     def compose_email(self, query: str):
         try:
             print("\n✉️ Starting New Email Composition")
-            draft = self.classifier._call_ai_api(f"Write a professional email about: {query}")
+            draft = self.classifier._call_ai_api(query, system=COMPOSE_SYSTEM_PROMPT)
             draft = self._clean_generated_email(draft)
             
-            print("\nGenerated Draft:")
-            print("=" * 50)
-            print(draft)
-            print("=" * 50)
+            print_block("\nGenerated Draft:", draft)
             
             recipient = input("Recipient email: ").strip()
             subject = input("Subject: ").strip()
@@ -1281,6 +1748,29 @@ class EmailProcessor:
             print(f"Error composing email: {str(e)}")
         
     def _edit_email_interactive(self, content: str) -> str:
+        if sys.stdin.isatty():
+            edited = self._edit_email_in_editor(content)
+            if edited is not None:
+                return edited
+        return self._edit_email_line_by_line(content)
+
+    def _edit_email_in_editor(self, content: str) -> Optional[str]:
+        editor = os.environ.get('VISUAL') or os.environ.get('EDITOR') or ('notepad' if os.name == 'nt' else 'vi')
+        print(f"\n✏️ Opening the draft in {editor} (save and close to continue)")
+        fd, path = tempfile.mkstemp(suffix='.eml', text=True)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+            subprocess.run(shlex.split(editor, posix=os.name != 'nt') + [path], check=True)
+            with open(path, encoding='utf-8') as f:
+                return f.read().rstrip('\n')
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"⚠️ Editor unavailable ({str(e)}), falling back to line editor")
+            return None
+        finally:
+            os.remove(path)
+
+    def _edit_email_line_by_line(self, content: str) -> str:
         print("\n✏️ Line Editor Mode (press Enter to keep line, type new text to edit)")
         print("Type '!exit' to finish editing, '!skip' to keep the rest as-is")
         lines = content.split('\n')
@@ -1304,20 +1794,34 @@ class EmailProcessor:
         return '\n'.join(edited_lines)
         
     def _edit_email_with_ai(self, content: str, instruction: str) -> str:
+        instruction = ' '.join(instruction.split())
+        revised = self._apply_edit_recipe(content, instruction)
+        if revised is not None:
+            return revised
+        
         prompt = (
-            f"Revise the following email based on these instructions: {instruction}\n\n"
-            f"Original email:\n{content}\n\n"
-            "Revised email (without any additional explanations or formatting):"
+            f"Instructions: {instruction}\n\n"
+            f"Original email:\n{content}"
         )
-        revised_content = self.classifier._call_ai_api(prompt)
+        revised_content = self.classifier._call_ai_api(prompt, system=EDIT_SYSTEM_PROMPT)
         return self._clean_generated_email(revised_content)
         
+    @staticmethod
+    def _apply_edit_recipe(content: str, instruction: str) -> Optional[str]:
+        """Apply edits that need no model, e.g. "change the time to 6pm" on a draft naming one time."""
+        time_edit = EDIT_TIME_INSTRUCTION_RE.fullmatch(instruction)
+        if time_edit:
+            mentions = DRAFT_TIME_RE.findall(content)
+            if len(mentions) == 1:
+                return DRAFT_TIME_RE.sub(time_edit.group(1), content)
+        return None
+
     def _present_editing_menu(self, email_content: str, original_query: str):
         current_content = email_content
         while True:
             print("\nChoose an option:")
             print("[1] Send email")
-            print("[2] Edit line-by-line")
+            print("[2] Edit in your editor (line-by-line if unavailable)")
             print("[3] Revise with AI instructions")
             print("[4] Regenerate from scratch")
             print("[5] Cancel and return to menu")
@@ -1335,27 +1839,18 @@ class EmailProcessor:
                     
             elif choice == "2":  
                 current_content = self._edit_email_interactive(current_content)
-                print("\nEdited Email:")
-                print("=" * 50)
-                print(current_content)
-                print("=" * 50)
+                print_block("\nEdited Email:", current_content)
                     
             elif choice == "3":  
                 instruction = input("Enter revision instructions (e.g., 'make it casual', 'change time to 6pm'): ")
                 current_content = self._edit_email_with_ai(current_content, instruction)
-                print("\nRevised Email:")
-                print("=" * 50)
-                print(current_content)
-                print("=" * 50)
+                print_block("\nRevised Email:", current_content)
                     
             elif choice == "4":  
                 new_prompt = input("Enter new instructions (or press Enter to keep original): ") or original_query
-                new_content = self.classifier._call_ai_api(f"Write a professional email about: {new_prompt}")
+                new_content = self.classifier._call_ai_api(new_prompt, use_cache=False, system=COMPOSE_SYSTEM_PROMPT)
                 current_content = self._clean_generated_email(new_content)
-                print("\nRegenerated Email:")
-                print("=" * 50)
-                print(current_content)
-                print("=" * 50)
+                print_block("\nRegenerated Email:", current_content)
                     
             elif choice == "5":  
                 print("Email composition cancelled.")
@@ -1367,19 +1862,21 @@ class EmailProcessor:
 
     def _detect_meeting_time(self, text: str) -> datetime:
         try:
-            email_date_match = re.search(r'(\d{1,2} [а-я]+\. \d{4} г\. в \d{1,2}:\d{2})', text)
+            # the quote header date is Cyrillic, so plain-ASCII text can't contain it
+            email_date_match = None if text.isascii() else EMAIL_DATE_RE.search(text)
             if email_date_match:
                 email_date_str = email_date_match.group(1)
+                import dateparser
 
                 email_date = dateparser.parse(
                     email_date_str, 
                     languages=['ru'],
-                    settings={'TIMEZONE': 'Asia/Dubai'}
+                    settings={'TIMEZONE': DUBAI_TZ_NAME}
                 )
             else:
                 email_date = datetime.now(DUBAI_TIMEZONE)
             
-            body_match = re.search(r'hey Kristina! (.+)', text)
+            body_match = GREETING_BODY_RE.search(text)
             if body_match:
                 body_text = body_match.group(1)
             else:
@@ -1387,20 +1884,20 @@ class EmailProcessor:
                 
             prompt = (
                 f"Email was sent on: {email_date.strftime('%Y-%m-%d %H:%M')} Dubai time\n"
-                f"Email content: {body_text}\n\n"
-                "What is the exact meeting date and time mentioned? "
-                "Respond ONLY in ISO 8601 format (YYYY-MM-DDTHH:MM:SS) for Asia/Dubai timezone. "
-                "If no time is mentioned, return 'none'."
+                f"Email content: {body_text}"
             )
             
             print("  Using AI to detect meeting time...")
-            response = self.classifier._call_ai_api(prompt).strip()
+            response = self.classifier._call_ai_api(prompt, system=MEETING_TIME_SYSTEM_PROMPT).strip()
             
-            clean_response = re.sub(r'[^0-9T:\-]', '', response)
+            clean_response = NON_ISO_CHARS_RE.sub('', response)
             if clean_response and clean_response.lower() != 'none':
-                dt = parser.isoparse(clean_response)
+                dt = _parse_iso(clean_response)
+                if dt is None:
+                    from dateutil import parser
+                    dt = parser.isoparse(clean_response)
                 if not dt.tzinfo:
-                    dt = DUBAI_TIMEZONE.localize(dt)
+                    dt = dt.replace(tzinfo=DUBAI_TIMEZONE)
                 return dt
         except Exception as e:
             print(f"AI detection failed: {str(e)}")
@@ -1410,11 +1907,32 @@ class EmailProcessor:
         end_time = start_time + timedelta(minutes=duration_minutes)
         return self.calendar.check_availability(start_time, end_time)
 
+    def _free_slots(self, candidates, busy: Optional[List[tuple]], duration_minutes: int = 60):
+        """Yield the candidates that don't clash with the busy blocks, in order."""
+        if busy is None:
+            # no busy list: probe one window of slots at a time, concurrently, so a caller that
+            # stops after a few free slots doesn't pay for probing every candidate
+            candidates = iter(candidates)
+            while True:
+                window = list(islice(candidates, CALENDAR_PROBE_WORKERS))
+                if not window:
+                    return
+                with ThreadPoolExecutor(max_workers=len(window)) as pool:
+                    free = list(pool.map(lambda c: self._is_time_available(c, duration_minutes), window))
+                # yielded after the pool is closed, so no threads are held while the caller consumes
+                yield from (c for c, ok in zip(window, free) if ok)
+        starts = [block[0] for block in busy]
+        duration = timedelta(minutes=duration_minutes)
+        for candidate in candidates:
+            # busy is sorted and non-overlapping: only the last block starting before the slot ends can clash
+            i = bisect_left(starts, candidate + duration)
+            if i == 0 or busy[i - 1][1] <= candidate:
+                yield candidate
+
     def _schedule_and_respond(self, subject, body, sender, start_time, response_message):
         end_time = start_time + timedelta(hours=1)
         
-        calendar = CalendarClient()
-        event_link = calendar.create_event(
+        event_link = self.calendar.create_event(
             summary=f"Meeting: {subject}",
             start_time=start_time,
             end_time=end_time,
@@ -1451,10 +1969,7 @@ class EmailProcessor:
             alternatives
         )
         
-        print("\n✉️ Response Draft:")
-        print("=" * 50)
-        print(response_body)
-        print("=" * 50)
+        print_block("\n✉️ Response Draft:", response_body)
         
         send = input("Send this response? (y/n): ").lower()
         if send == 'y':
@@ -1469,57 +1984,71 @@ class EmailProcessor:
                 return True
         return False
 
-    def _find_available_times(self, original_time, max_results=3):
-        alternatives = []
-        time_slots = [
+    @staticmethod
+    def _alternative_slots(original_time):
+        """Shifts of the requested time first, then PROPOSAL_HOURS slots on the following days, without repeats."""
+        nearby = (
             original_time + timedelta(hours=1),
             original_time - timedelta(hours=1),
-            original_time + timedelta(days=1, hours=original_time.hour),
+            original_time + timedelta(days=1),
             original_time - timedelta(days=1),
-            original_time + timedelta(weeks=1)
-        ]
-        
-        for slot in time_slots:
-            if self._is_time_available(slot):
-                alternatives.append(slot)
-                if len(alternatives) >= max_results:
-                    break
+            original_time + timedelta(weeks=1),
+        )
+        day_start = original_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        # stays inside the week _find_available_times fetches busy blocks for
+        later = (
+            day_start + timedelta(days=day, hours=hour)
+            for day in range(1, PROPOSAL_SEARCH_DAYS)
+            for hour in PROPOSAL_HOURS
+        )
+        seen = set()
+        for slot in chain(nearby, later):
+            if slot not in seen:
+                seen.add(slot)
+                yield slot
+
+    def _find_available_times(self, original_time, max_results=3):
+        # the window spans every slot _alternative_slots can produce, without materializing them
+        busy = self.calendar.get_busy_intervals(
+            original_time - timedelta(days=1),
+            original_time + timedelta(weeks=1, hours=1)
+        )
         
-        return alternatives
+        return list(islice(self._free_slots(self._alternative_slots(original_time), busy), max_results))
 
     def _generate_alternative_time_response(self, body, original_time, alternatives):
-        original_str = original_time.strftime('%A, %B %d at %I:%M %p')
-        alt_str = "\n".join([f"- {t.strftime('%A, %B %d at %I:%M %p')}" for t in alternatives])
-        
-        prompt = (
-            f"Compose a polite email response suggesting alternative meeting times. "
-            f"Original proposed time was: {original_str}\n"
-            f"Available times:\n{alt_str}\n\n"
-            f"Reference the original message: {body[:300]}\n\n"
-            "Response should be professional and include all alternative times."
+        original_str = original_time.strftime(MEETING_TIME_FORMAT)
+        alt_str = "\n".join("- " + t.strftime(MEETING_TIME_FORMAT) for t in alternatives)
+        # collapsed whitespace keeps the prompt (and its cache key) the same for re-wrapped copies of a message
+        context = WHITESPACE_RE.sub(' ', body[:600]).strip()[:300]
+        
+        # The times are left as placeholders so the cached reply for this email can be reused
+        # when the free slots change; a reply missing the list gets the times appended instead.
+        template = self.classifier._call_ai_api(
+            "Compose a polite email response explaining that the originally proposed time is not available "
+            "and suggesting alternative meeting times. "
+            f"Write the placeholder {ORIGINAL_TIME_SLOT} exactly where the unavailable original time belongs "
+            f"and the placeholder {ALTERNATIVE_TIMES_SLOT} exactly where the list of available times belongs.\n\n"
+            f"Reference the original message: {context}\n\n"
+            "Response should be professional and friendly."
         )
-        
-        return self.classifier._call_ai_api(prompt)
+        reply = template.replace(ORIGINAL_TIME_SLOT, original_str)
+        if ALTERNATIVE_TIMES_SLOT in reply:
+            return reply.replace(ALTERNATIVE_TIMES_SLOT, alt_str)
+        return f"{reply.rstrip()}\n\nAvailable times:\n{alt_str}"
 
     def _propose_new_time(self, email, sender):
         print("⌚ Finding next available time...")
-        now = datetime.now(pytz.utc)
-        next_available = None
-        
-        for day in range(0, 7):
-            for hour in [9, 11, 14, 16]:
-                candidate = now + timedelta(days=day, hours=hour)
-                if self._is_time_available(candidate):
-                    next_available = candidate
-                    break
-            if next_available:
-                break
+        now = datetime.now(timezone.utc)
+        busy = self.calendar.get_busy_intervals(now, now + PROPOSAL_OFFSETS[-1] + timedelta(hours=1))
+        candidates = (now + offset for offset in PROPOSAL_OFFSETS)
+        next_available = next(self._free_slots(candidates, busy), None)
         
         if not next_available:
             print("⚠️ No available times found in next 7 days")
             return False
         
-        print(f"Next available time: {next_available.strftime('%A, %B %d at %I:%M %p')}")
+        print(f"Next available time: {next_available.strftime(MEETING_TIME_FORMAT)}")
         response = input("Propose this time? (y/n): ").lower()
         
         if response == 'y':
@@ -1528,96 +2057,98 @@ class EmailProcessor:
                 email.get('body', ''),
                 sender,
                 next_available,
-                f"Thanks for your invitation! How about {next_available.strftime('%A, %B %d at %I:%M %p')}?"
+                f"Thanks for your invitation! How about {next_available.strftime(MEETING_TIME_FORMAT)}?"
             )
         return False
 
-    def _schedule_meeting(self, default_attendees=None, default_summary=""):
+    def _schedule_meeting(self, default_attendees=None, default_summary="", summary=None, location=None,
+                          attendees=None, start_time=None, duration=None, confirm=True):
+        """Create a calendar event, prompting only for the fields not passed in.
+
+        With every field given and confirm=False no input() is reached, so callers
+        without a terminal can use it too.
+        """
         if default_attendees is None:
             default_attendees = []
         try:
             print("\n📅 Schedule a Meeting")
             print("="*50)
             
-            while True:
+            while not summary:
                 summary = input(f"Meeting title [{default_summary}]: ").strip() or default_summary
-                if summary:
-                    break
-                print("❌ Meeting title cannot be empty. Please enter a title.")
+                if not summary:
+                    print("❌ Meeting title cannot be empty. Please enter a title.")
 
-            location = input("Location (optional): ").strip()
-            
-            attendees = []
-            print("\nEnter attendee emails (one per line). Type 'done' when finished:")
+            if location is None:
+                location = input("Location (optional): ").strip()
             
-            if default_attendees:
-                print(f"Default attendees: {', '.join(default_attendees)}")
-                use_default = input("Use these attendees? (y/n): ").strip().lower()
-                if use_default == 'y':
-                    attendees = default_attendees
-            
-            if not attendees:
-                print("Add at least one attendee:")
-                attendee_count = 0
-                while True:
-                    attendee = input(f"Attendee #{len(attendees)+1} email: ").strip()
-                    
-                    if attendee.lower() == 'done':
-                        if attendees:
-                            break
-                        print("❌ You must add at least one attendee.")
-                        continue
+            if attendees is None:
+                attendees = []
+                print("\nEnter attendee emails (one per line). Type 'done' when finished:")
+                
+                if default_attendees:
+                    print(f"Default attendees: {', '.join(default_attendees)}")
+                    use_default = input("Use these attendees? (y/n): ").strip().lower()
+                    if use_default == 'y':
+                        attendees = default_attendees
+                
+                if not attendees:
+                    print("Add at least one attendee:")
+                    while True:
+                        attendee = input(f"Attendee #{len(attendees)+1} email: ").strip()
                         
-                    if not '@' in attendee:
-                        print("❌ Invalid email format. Must contain '@'. Example: user@example.com")
-                        continue
+                        if attendee.lower() == 'done':
+                            if attendees:
+                                break
+                            print("❌ You must add at least one attendee.")
+                            continue
+                            
+                        if not EMAIL_ADDRESS_RE.fullmatch(attendee):
+                            print("❌ Invalid email format. Example: user@example.com")
+                            continue
+                            
+                        attendees.append(attendee)
+                        print(f"✓ Added {attendee}")
                         
-                    attendees.append(attendee)
-                    print(f"✓ Added {attendee}")
-                    
-                    if len(attendees) > 0:
                         another = input("Add another? (y/n): ").lower().strip()
                         if another != 'y':
                             break
             
-            while True:
+            while start_time is None:
                 start_str = input("Start time (YYYY-MM-DD HH:MM): ").strip()
                 try:
                     start_time = datetime.strptime(start_str, "%Y-%m-%d %H:%M")
-                    break
                 except ValueError:
                     print("❌ Invalid format. Please use YYYY-MM-DD HH:MM format. Example: 2025-08-15 14:30")
             
-            while True:
+            while duration is None:
                 duration_str = input("Duration in minutes: ").strip()
                 try:
                     duration = int(duration_str)
-                    if duration <= 0:
-                        print("❌ Duration must be a positive number.")
-                        continue
-                    end_time = start_time + timedelta(minutes=duration)
-                    break
                 except ValueError:
                     print("❌ Please enter a valid number (e.g., 30, 60, 90).")
+                    continue
+                if duration <= 0:
+                    print("❌ Duration must be a positive number.")
+                    duration = None
             
-            start_time = DUBAI_TIMEZONE.localize(start_time)
-            end_time = DUBAI_TIMEZONE.localize(end_time)
+            if start_time.tzinfo is None:
+                start_time = start_time.replace(tzinfo=DUBAI_TIMEZONE)
+            end_time = start_time + timedelta(minutes=duration)
             
             print("\n📝 Meeting Details:")
             print(f"Title: {summary}")
-            print(f"Time: {start_time.strftime('%A, %B %d at %I:%M %p')} to {end_time.strftime('%I:%M %p')}")
+            print(f"Time: {start_time.strftime(MEETING_TIME_FORMAT)} to {end_time.strftime('%I:%M %p')}")
             print(f"Duration: {duration} minutes")
             print(f"Attendees: {', '.join(attendees)}")
             if location:
                 print(f"Location: {location}")
             
-            confirm = input("\nSchedule this meeting? (y/n): ").lower().strip()
-            if confirm != 'y':
+            if confirm and input("\nSchedule this meeting? (y/n): ").lower().strip() != 'y':
                 print("❌ Meeting scheduling cancelled.")
                 return False
             
-            calendar = CalendarClient()
-            event_link = calendar.create_event(
+            event_link = self.calendar.create_event(
                 summary=summary,
                 start_time=start_time,
                 end_time=end_time,
@@ -1639,7 +2170,7 @@ class CLIInterface:
     def __init__(self):
         try:
             self.email_processor = EmailProcessor()
-            self.calendar_client = CalendarClient()
+            self.calendar_client = self.email_processor.calendar
         except Exception as e:
             print(f"❌ Failed to initialize: {str(e)}")
             self.email_processor = None
@@ -1687,6 +2218,9 @@ class CLIInterface:
                 print(f"\nAn error occurred: {str(e)}")
                 print("Returning to main menu...")
                 continue
+            finally:
+                # each menu action is one unit of work for the database sessions
+                self.email_processor.db.remove_sessions()
 
     def compose_email(self):
         try:
@@ -1707,17 +2241,14 @@ class CLIInterface:
                 print("\nNo upcoming events found.")
                 return
                 
-            print("\n📅 Upcoming Events:")
-            print("=" * 50)
-            for event in events:
-                start = event['start'].get('dateTime', event['start'].get('date'))
-                print(f"{event['summary']} ({start})")
-            print("=" * 50)
+            print_block("\n📅 Upcoming Events:", "\n".join(
+                f"{event['summary']} ({event['start'].get('dateTime', event['start'].get('date'))})"
+                for event in events
+            ))
             
         except Exception as e:
             print(f"Error viewing events: {str(e)}")
 if __name__ == "__main__":
-    CLIInterface().show_menu()
     from database import init_db
     init_db()
     CLIInterface().show_menu()
@@ -1,29 +1,35 @@
 import os
 import base64
-import json
+import orjson
+import re
 import uuid
 import time
-from flask import Flask, jsonify, request, session, redirect, url_for
+import functools
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
+from flask import Flask, g, jsonify, request, session, redirect, url_for
+from flask.json.provider import JSONProvider
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from google.auth.transport.requests import Request
 from email.message import EmailMessage
 import mimetypes
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from config import REDIRECT_URI, BASE_DIR, TOKEN_PATH, CREDENTIALS_PATH, WEB_CREDENTIALS_PATH
-from datetime import timedelta, datetime
-import pytz
+from datetime import timedelta, datetime, timezone
+from zoneinfo import ZoneInfo
 from core import EmailClassifier, GmailClient, CalendarClient, EmailProcessor, DUBAI_TIMEZONE
-from dateutil import parser
 from dotenv import load_dotenv
 
 # Load .env from project root
 load_dotenv()
 
 
-DUBAI_TIMEZONE = pytz.timezone('Asia/Dubai')
+DUBAI_TIMEZONE = ZoneInfo('Asia/Dubai')
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 API_URL = "https://api.deepseek.com/v1/chat/completions"
 
@@ -35,8 +41,18 @@ SCOPES = [
     'https://www.googleapis.com/auth/gmail.modify',
     'https://www.googleapis.com/auth/calendar.events'
 ]
+class OrjsonProvider(JSONProvider):
+    """jsonify (and the session cookie) through orjson instead of the stdlib encoder."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 # app configuration
 app = Flask(__name__, static_folder='.', static_url_path='')
+app.json = OrjsonProvider(app)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev-secret")
 app.config.update(
     SESSION_COOKIE_SECURE=False,
@@ -48,30 +64,80 @@ app.config.update(
 # Initialize core services
 email_classifier = EmailClassifier()
 
+def get_session_credentials():
+    # built from the session once per request and shared by every helper that needs them
+    if 'creds' not in g:
+        creds_dict = session['credentials']
+        g.creds = Credentials(
+            token=creds_dict['token'],
+            refresh_token=creds_dict['refresh_token'],
+            token_uri=creds_dict['token_uri'],
+            client_id=creds_dict['client_id'],
+            client_secret=creds_dict['client_secret'],
+            scopes=creds_dict['scopes']
+        )
+    return g.creds
+
 def get_email_processor():
     if 'credentials' not in session:
         return None
+    if 'processor' not in g:
+        creds = get_session_credentials()
+        gmail_client = GmailClient(credentials=creds)
+        calendar_client = CalendarClient(credentials=creds)
         
-    creds_dict = session['credentials']
-    creds = Credentials(
-        token=creds_dict['token'],
-        refresh_token=creds_dict['refresh_token'],
-        token_uri=creds_dict['token_uri'],
-        client_id=creds_dict['client_id'],
-        client_secret=creds_dict['client_secret'],
-        scopes=creds_dict['scopes']
-    )
-
-    gmail_client = GmailClient(credentials=creds)
-    calendar_client = CalendarClient(credentials=creds)
-    
-    # Revert to original implementation
-    return EmailProcessor(gmail_client, calendar_client)
+        # Revert to original implementation
+        g.processor = EmailProcessor(gmail_client, calendar_client)
+    return g.processor
 # Mock data storage
-processed_items = []
-events = []
-failed_items = []
-drafts = []
+PROCESSED_ITEMS_LIMIT = 10_000
+processed_items = deque(maxlen=PROCESSED_ITEMS_LIMIT)  # oldest entries fall off once full
+processed_by_id = {}  # id -> latest processed item, so lookups don't scan the list
+# id -> item; the request threads share these, so writes and snapshots go through _store_lock
+events = {}
+failed_items = {}
+drafts = {}
+_store_lock = threading.Lock()
+
+# same loose shape check main.py applies to attendees: one @, a dot in the domain, no spaces
+EMAIL_ADDRESS_RE = re.compile(r'[^\s@]+@[^\s@]+\.[^\s@]+')
+
+EMAIL_CACHE_MAXSIZE = 1024
+EMAIL_CACHE_TTL = 300  # seconds
+# (account, message id) -> (expires, email); processors are per request, so the cache lives here
+_email_cache = OrderedDict()
+_email_cache_lock = threading.Lock()
+
+def get_email_content_cached(processor, message_id):
+    account = session.get('account')
+    if not account:
+        # without a known mailbox the entry could be served to another account
+        return processor.gmail.get_email_content(message_id)
+    key = (account, message_id)
+    now = time.monotonic()
+    with _email_cache_lock:
+        entry = _email_cache.get(key)
+        if entry is not None and entry[0] > now:
+            _email_cache.move_to_end(key)
+            return dict(entry[1])
+    email = processor.gmail.get_email_content(message_id)
+    if email:
+        with _email_cache_lock:
+            _email_cache[key] = (now + EMAIL_CACHE_TTL, dict(email))
+            _email_cache.move_to_end(key)
+            if len(_email_cache) > EMAIL_CACHE_MAXSIZE:
+                _email_cache.popitem(last=False)
+    return email
+
+def _remember_processed(item):
+    with _store_lock:
+        if len(processed_items) == processed_items.maxlen:
+            oldest = processed_items[0]
+            # only drop the index entry if it still points at the item being evicted
+            if processed_by_id.get(oldest['id']) is oldest:
+                del processed_by_id[oldest['id']]
+        processed_items.append(item)
+        processed_by_id[item['id']] = item
 
 @app.route('/api/counts', methods=['GET'])
 def get_counts():
@@ -88,7 +154,8 @@ def get_processed():
     page_size = 10
     start = (page - 1) * page_size
     end = start + page_size
-    items = processed_items[start:end]
+    with _store_lock:
+        items = list(islice(processed_items, start, end))
     return jsonify({
         "items": items,
         "total_pages": (len(processed_items) + page_size - 1) // page_size
@@ -97,12 +164,16 @@ def get_processed():
 @app.route('/api/events', methods=['GET'])
 def get_events():
     """Return calendar events (mock implementation)"""
-    return jsonify({"items": events})
+    with _store_lock:
+        items = list(events.values())
+    return jsonify({"items": items})
 
 @app.route('/api/failed', methods=['GET'])
 def get_failed():
     """Return failed items (mock implementation)"""
-    return jsonify({"items": failed_items})
+    with _store_lock:
+        items = list(failed_items.values())
+    return jsonify({"items": items})
 
 @app.route('/api/search', methods=['GET'])
 def search():
@@ -123,7 +194,7 @@ def process_email(id):
         return jsonify({"error": "Not authenticated"}), 401
         
     try:
-        email = processor.gmail.get_email_content(id)
+        email = get_email_content_cached(processor, id)
         if not email:
             return jsonify({"error": "Email not found"}), 404
             
@@ -143,7 +214,7 @@ def process_email(id):
             "actions": actions,
             "date": datetime.now().isoformat()
         }
-        processed_items.append(processed_item)
+        _remember_processed(processed_item)
             
         return jsonify({
             "status": "processed",
@@ -156,7 +227,7 @@ def process_email(id):
 def get_processed_email(id):
     """Get processed email metadata by ID"""
     # Find processed item by ID
-    item = next((item for item in processed_items if item['id'] == id), None)
+    item = processed_by_id.get(id)
     
     if item:
         return jsonify(item)
@@ -173,19 +244,20 @@ def safe_credentials_to_dict(credentials):
         'scopes': credentials.scopes
     }
 
+@functools.lru_cache(maxsize=None)
+def _discovery_text(service_name, version):
+    # the bundled discovery doc is read once per process instead of on every request
+    return get_static_doc(service_name, version)
+
+def _discovery_document(service_name, version):
+    # build_from_document fills in the dict it is given, so request threads each get their own
+    return orjson.loads(_discovery_text(service_name, version))
+
 def get_gmail_service():
     if 'credentials' not in session:
         return None
     
-    creds_dict = session['credentials']
-    creds = Credentials(
-        token=creds_dict['token'],
-        refresh_token=creds_dict['refresh_token'],
-        token_uri=creds_dict['token_uri'],
-        client_id=creds_dict['client_id'],
-        client_secret=creds_dict['client_secret'],
-        scopes=creds_dict['scopes']
-    )
+    creds = get_session_credentials()
     
     if creds.expired and creds.refresh_token:
         try:
@@ -196,7 +268,7 @@ def get_gmail_service():
             print(f"Error refreshing token: {e}")
             return None
     
-    return build('gmail', 'v1', credentials=creds)
+    return build_from_document(_discovery_document('gmail', 'v1'), credentials=creds)
 
 @app.route('/')
 def index():
@@ -275,6 +347,13 @@ def oauth2callback():
             'client_secret': credentials.client_secret,
             'scopes': credentials.scopes
         }
+        session.pop('account', None)
+        try:
+            # the mailbox address keys per-account caches; refresh tokens can be missing
+            gmail = build_from_document(_discovery_document('gmail', 'v1'), credentials=credentials)
+            session['account'] = gmail.users().getProfile(userId='me').execute()['emailAddress']
+        except Exception as e:
+            print(f"Could not read Gmail profile: {e}")
         session.modified = True
         print("Credentials stored in session")
         
@@ -295,7 +374,7 @@ def get_emails():
         page_size = 10
         
         # Get recent emails (last 24 hours)
-        cutoff = datetime.now(pytz.utc) - timedelta(hours=24)
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=24)
         emails = processor.gmail.get_recent_emails(
             max_results=page_size * 2, 
             after_date=cutoff.isoformat()
@@ -339,11 +418,11 @@ def get_email(id):
         return jsonify({"error": "Not authenticated"}), 401
     
     try:
-        email = processor.gmail.get_email_content(id)
+        email = get_email_content_cached(processor, id)
         if not email:
             return jsonify({"error": "Email not found"}), 404
         
-        processed_data = next((item for item in processed_items if item['id'] == id), None)
+        processed_data = processed_by_id.get(id)
         if processed_data:
             email['processed'] = processed_data
             
@@ -395,7 +474,8 @@ def save_draft():
         "body": data.get('body', ''),
         "saved_at": time.strftime("%Y-%m-%d %H:%M")
     }
-    drafts.append(draft)
+    with _store_lock:
+        drafts[draft["id"]] = draft
     return jsonify({"status": "draft_saved", "id": draft["id"]})
 
 @app.route('/api/generate', methods=['POST'])
@@ -429,9 +509,17 @@ def schedule_event():
         start_str = data.get('start', '')
         duration = data.get('duration', 60)
         attendees = data.get('attendees', [])
+        if not isinstance(attendees, list) or not all(
+            isinstance(a, str) and EMAIL_ADDRESS_RE.fullmatch(a) for a in attendees
+        ):
+            return jsonify({"error": "Attendees must be a list of valid email addresses"}), 400
         
-        # Parse and validate times
-        start_time = parser.parse(start_str)
+        # Parse and validate times; the frontend sends ISO 8601, anything else goes through dateutil
+        try:
+            start_time = datetime.fromisoformat(start_str)
+        except ValueError:
+            from dateutil import parser
+            start_time = parser.parse(start_str)
         end_time = start_time + timedelta(minutes=duration)
         
         # Create event